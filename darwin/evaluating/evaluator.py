@@ -16,7 +16,10 @@ class Evaluator:
         )
 
     def __evaluate(self, code: str, inputs: tuple, function: str) -> int:
-        global_dict = globals()
-        exec(code, global_dict)
-        score = eval(f"{function}{inputs}", global_dict)
-        return score
+        # Fresh namespace for every program, nothing it defines outlives the evaluation
+        namespace = {}
+        try:
+            exec(code, namespace)
+            return namespace[function](*inputs)
+        finally:
+            namespace.clear()
@@ -1,11 +1,17 @@
 from abc import ABC, abstractmethod
 from enum import Enum
+from typing import List
 
 class Backend(ABC):
     @abstractmethod
     async def prompt(self, prompt: str) -> str:
         pass
 
+    async def prompt_n(self, prompt: str, n: int) -> List[str]:
+        # Sequential on purpose: servers that cache the prompt prefix only pay the
+        # prefill for the first completion
+        return [await self.prompt(prompt) for _ in range(n)]
+
 
 class BackendType(Enum):
     ollama = 0
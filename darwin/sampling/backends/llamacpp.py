@@ -1,5 +1,6 @@
 import asyncio
 from pathlib import Path
+from typing import List
 from llama_cpp import Llama
 import functools
 from darwin.sampling.backend import Backend
@@ -27,27 +28,39 @@ class LlamaCPPBackend(Backend):
     async def prompt(self, prompt: str) -> str:
         loop = asyncio.get_event_loop()
         try:
-            return str(
-                (
-                    await loop.run_in_executor(
-                        None,
-                        functools.partial(
-                            self.llm.create_chat_completion,
-                            messages=[
-                                {
-                                    "role": "system",
-                                    "content": "You are a helpful assistant that's knowledgeable in python coding and mathematics. Be concise and only do what's asked of you directly.",
-                                },
-                                {"role": "user", "content": prompt},
-                            ],
-                            temperature=0.8,
-                            top_p=0.4,
-                            seed=-1,
-                            max_tokens=1024,
-                        ),
-                    )
-                )["choices"][0]["message"]["content"]
+            return await loop.run_in_executor(
+                None, functools.partial(self.__complete, prompt)
             )
         except Exception:
             # TODO: Get logging sorted out
             return ""
+
+    async def prompt_n(self, prompt: str, n: int) -> List[str]:
+        # llama.cpp keeps the evaluated tokens of the last call around and only
+        # evaluates what differs, so every completion after the first skips the
+        # prompt prefill. Run them back to back so nothing else touches the context.
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.run_in_executor(
+                None,
+                lambda: [self.__complete(prompt) for _ in range(n)],
+            )
+        except Exception:
+            return [""] * n
+
+    def __complete(self, prompt: str) -> str:
+        return str(
+            self.llm.create_chat_completion(
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are a helpful assistant that's knowledgeable in python coding and mathematics. Be concise and only do what's asked of you directly.",
+                    },
+                    {"role": "user", "content": prompt},
+                ],
+                temperature=0.8,
+                top_p=0.4,
+                seed=-1,
+                max_tokens=1024,
+            )["choices"][0]["message"]["content"]
+        )
@@ -1,14 +1,24 @@
-import json
-import aiohttp
+from contextlib import aclosing
 
+from darwin.postprocessing.parser import StreamWatcher
 from darwin.sampling.backend import Backend
 from darwin.sampling.models import ModelType
+from darwin.sampling.sessions import SessionPool, shared_pool
 
 
 class OllamaBackend(Backend):
-    def __init__(self, server_address: str, model: ModelType) -> None:
+    def __init__(
+        self,
+        server_address: str,
+        model: ModelType,
+        session_pool: SessionPool | None = None,
+        stream: bool = False,
+    ) -> None:
         super().__init__()
         self.server_address = server_address
+        self.session_pool = session_pool or shared_pool
+        # Stream the completion and stop once the code block is complete
+        self.stream = stream
         match model:
             case ModelType.deepseekcoder67:
                 self.model = "deepseek-coder:6.7b"
@@ -26,16 +36,20 @@ class OllamaBackend(Backend):
         headers = {
             "Content-Type": "application/x-www-form-urlencoded",
         }
-        data = {"model": self.model, "prompt": prompt, "stream": False}
-        async with aiohttp.ClientSession() as s:
-            async with s.post(
-                f"{self.server_address}/api/generate",
-                data=json.dumps(data),
-                headers=headers,
-            ) as response:
-                response = await response.json()
-                result = response["response"]
-                return result
+        data = {"model": self.model, "prompt": prompt, "stream": self.stream}
+        if not self.stream:
+            response = await self.session_pool.post(
+                f"{self.server_address}/api/generate", data, headers=headers
+            )
+            return response["response"]
 
-
-# TODO: make more efficient by not creating session one very request
+        watcher = StreamWatcher()
+        async with aclosing(
+            self.session_pool.stream(
+                f"{self.server_address}/api/generate", data, headers=headers
+            )
+        ) as chunks:
+            async for chunk in chunks:
+                if watcher.feed(chunk.get("response", "")) or chunk.get("done"):
+                    break
+        return watcher.text
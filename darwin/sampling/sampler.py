@@ -1,3 +1,5 @@
+from typing import List
+
 from darwin.sampling.backend import BackendType
 from darwin.sampling.backends.groq import GroqBackend
 from darwin.sampling.backends.llamacpp import LlamaCPPBackend
@@ -30,6 +32,8 @@ class Sampler:
                 self.backend = OllamaBackend(
                     server_address=kwargs["ollama_server_address"],
                     model=model,
+                    session_pool=kwargs.get("session_pool"),
+                    stream=kwargs.get("stream", False),
                 )
             case BackendType.groq:
                 self.backend = GroqBackend(model)
@@ -43,3 +47,6 @@ class Sampler:
 
     async def sample(self, prompt: str) -> str:
         return await self.backend.prompt(f"{self.prompt_supplement}\n\n{prompt}")
+
+    async def sample_n(self, prompt: str, n: int) -> List[str]:
+        return await self.backend.prompt_n(f"{self.prompt_supplement}\n\n{prompt}", n)
@@ -0,0 +1,83 @@
+import json
+from typing import Any, AsyncIterator, Dict
+from urllib.parse import urlsplit
+
+import aiohttp
+
+
+class SessionPool:
+    """Keep-alive HTTP sessions shared by every backend in the process
+
+    One `aiohttp.ClientSession` is kept per server origin (scheme://host:port) so
+    requests to the same server reuse pooled connections instead of opening a new
+    session for every prompt.
+    """
+
+    def __init__(
+        self,
+        connections_per_endpoint: int = 16,
+        keepalive_timeout: float = 60.0,
+        request_timeout: float = 600.0,
+        connect_timeout: float = 10.0,
+    ) -> None:
+        self.connections_per_endpoint = connections_per_endpoint
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(
+            total=request_timeout, connect=connect_timeout
+        )
+        self.sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    def session(self, endpoint: str) -> aiohttp.ClientSession:
+        url = urlsplit(endpoint)
+        origin = f"{url.scheme}://{url.netloc}"
+        session = self.sessions.get(origin)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.connections_per_endpoint,
+                    keepalive_timeout=self.keepalive_timeout,
+                ),
+                timeout=self.timeout,
+            )
+            self.sessions[origin] = session
+        return session
+
+    async def post(
+        self,
+        endpoint: str,
+        payload: Dict[str, Any],
+        headers: Dict[str, str] | None = None,
+    ) -> Dict[str, Any]:
+        async with self.session(endpoint).post(
+            endpoint, data=json.dumps(payload), headers=headers
+        ) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def stream(
+        self,
+        endpoint: str,
+        payload: Dict[str, Any],
+        headers: Dict[str, str] | None = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the JSON objects of a newline-delimited streaming response
+
+        Closing the generator early drops the connection, which makes the server stop
+        generating.
+        """
+        async with self.session(endpoint).post(
+            endpoint, data=json.dumps(payload), headers=headers
+        ) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                if line.strip():
+                    yield json.loads(line)
+
+    async def close(self) -> None:
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions.clear()
+
+
+# Used by backends that aren't given a pool of their own
+shared_pool = SessionPool()
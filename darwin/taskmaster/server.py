@@ -57,8 +57,16 @@ class SamplerServer(Server):
             )
 
         self.last_sample_time = datetime.now()
-        self.n_samples += 1
         self.active = True
+        if request.get("n", 1) > 1:
+            # Several completions of the same prompt, all for the same island
+            results = await self.sampler.sample_n(request["prompt"], request["n"])
+            self.n_samples += len(results)
+            self.active = False
+            return web.json_response(
+                data={"codes": results, "island_id": request["island_id"]}
+            )
+        self.n_samples += 1
         result = await self.sampler.sample(request["prompt"])
         self.active = False
         return web.json_response(
@@ -0,0 +1,153 @@
+import hashlib
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+
+class EndpointStats:
+    CLOSED = "closed"
+    OPEN = "open"
+
+    def __init__(self) -> None:
+        self.outstanding: int = 0
+        # Exponentially weighted moving average of the request latency in seconds
+        self.latency: float | None = None
+        self.consecutive_failures: int = 0
+        self.state: str = EndpointStats.CLOSED
+        self.opened_at: float = 0.0
+        self.n_requests: int = 0
+        self.n_failures: int = 0
+
+
+class EndpointSelector:
+    """Routes LLM requests to the least loaded healthy endpoint
+
+    Each endpoint is scored by (outstanding requests + 1) * EWMA latency, so a server
+    that is slow or already busy gets less traffic. Endpoints that haven't answered
+    yet are tried first.
+
+    A circuit breaker ejects an endpoint after `failure_threshold` consecutive
+    failures. Once `cooldown` seconds have passed it is due for a health probe
+    (see `due_for_probe`), and a successful probe re-admits it.
+
+    The same selector is shared by samplers and correctors, so load from both is
+    accounted for on servers that do both.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[str],
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        latency_alpha: float = 0.2,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.latency_alpha = latency_alpha
+        self.endpoints: Dict[str, EndpointStats] = {
+            endpoint: EndpointStats() for endpoint in endpoints
+        }
+
+    def healthy(self, candidates: List[str]) -> List[str]:
+        return [
+            c for c in candidates if self.endpoints[c].state == EndpointStats.CLOSED
+        ]
+
+    def select(self, candidates: List[str]) -> str:
+        healthy = self.healthy(candidates)
+        if not healthy:
+            # Everything is ejected, so try the endpoint that has been out the longest
+            return min(candidates, key=lambda c: self.endpoints[c].opened_at)
+
+        known = [
+            self.endpoints[c].latency
+            for c in healthy
+            if self.endpoints[c].latency is not None
+        ]
+        default_latency = sum(known) / len(known) if known else 1.0
+
+        def cost(endpoint: str) -> float:
+            stats = self.endpoints[endpoint]
+            if stats.latency is None and stats.outstanding == 0:
+                return 0.0
+            return (stats.outstanding + 1) * (stats.latency or default_latency)
+
+        costs = [cost(c) for c in healthy]
+        lowest = min(costs)
+        return random.choice([c for c, x in zip(healthy, costs) if x == lowest])
+
+    def preferred(self, key: int, candidates: List[str]) -> List[str]:
+        """Order `candidates` by preference for `key` (rendezvous hashing)
+
+        The same key always prefers the same endpoint, and adding or removing an
+        endpoint only moves the keys that preferred it.
+        """
+        return sorted(
+            candidates,
+            key=lambda c: hashlib.md5(f"{key}:{c}".encode()).digest(),
+            reverse=True,
+        )
+
+    @contextmanager
+    def track(self, endpoint: str) -> Iterator[None]:
+        """Account for a request to `endpoint` made inside the with block"""
+        stats = self.endpoints[endpoint]
+        stats.outstanding += 1
+        stats.n_requests += 1
+        start = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.__failure(stats)
+            raise
+        else:
+            self.__success(stats, time.monotonic() - start)
+        finally:
+            stats.outstanding -= 1
+
+    def due_for_probe(self) -> List[str]:
+        now = time.monotonic()
+        return [
+            endpoint
+            for endpoint, stats in self.endpoints.items()
+            if stats.state == EndpointStats.OPEN
+            and now - stats.opened_at >= self.cooldown
+        ]
+
+    def probed(self, endpoint: str, healthy: bool) -> None:
+        stats = self.endpoints[endpoint]
+        if healthy:
+            stats.state = EndpointStats.CLOSED
+            stats.consecutive_failures = 0
+        else:
+            stats.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            endpoint: {
+                "state": stats.state,
+                "outstanding": stats.outstanding,
+                "latency": round(stats.latency, 3) if stats.latency else None,
+                "requests": stats.n_requests,
+                "failures": stats.n_failures,
+            }
+            for endpoint, stats in self.endpoints.items()
+        }
+
+    def __success(self, stats: EndpointStats, latency: float) -> None:
+        stats.consecutive_failures = 0
+        if stats.latency is None:
+            stats.latency = latency
+        else:
+            stats.latency += self.latency_alpha * (latency - stats.latency)
+
+    def __failure(self, stats: EndpointStats) -> None:
+        stats.n_failures += 1
+        stats.consecutive_failures += 1
+        if (
+            stats.state == EndpointStats.CLOSED
+            and stats.consecutive_failures >= self.failure_threshold
+        ):
+            stats.state = EndpointStats.OPEN
+            stats.opened_at = time.monotonic()
@@ -0,0 +1,64 @@
+from typing import Dict
+
+import numpy as np
+
+
+class ModelBandit:
+    """Thompson sampling over models, rewarded by island improvements per second
+
+    Each model's rate of improvements (samples that beat the best score of their
+    island) per second of LLM time gets a Gamma posterior. A model's weight is the
+    probability that its rate is the highest, estimated from `n_draws` posterior
+    draws. Every model keeps at least `floor` of the mix so that one unlucky early
+    stretch doesn't starve it forever.
+    """
+
+    def __init__(
+        self,
+        prior: Dict[str, float],
+        floor: float = 0.05,
+        prior_improvements: float = 1.0,
+        prior_seconds: float = 60.0,
+        n_draws: int = 1000,
+    ) -> None:
+        self.models = list(prior.keys())
+        self.floor = floor
+        self.n_draws = n_draws
+        self.improvements = np.full(len(self.models), prior_improvements)
+        self.seconds = np.full(len(self.models), prior_seconds)
+        self.current: Dict[str, float] = dict(prior)
+        self.dirty = False
+
+    def record_time(self, model: str, seconds: float) -> None:
+        if model in self.current:
+            self.seconds[self.models.index(model)] += seconds
+            self.dirty = True
+
+    def record_improvement(self, model: str) -> None:
+        if model in self.current:
+            self.improvements[self.models.index(model)] += 1
+            self.dirty = True
+
+    def weights(self) -> Dict[str, float]:
+        if self.dirty:
+            self.dirty = False
+            draws = np.random.gamma(
+                self.improvements, 1 / self.seconds, (self.n_draws, len(self.models))
+            )
+            p_best = np.bincount(
+                np.argmax(draws, axis=1), minlength=len(self.models)
+            ) / self.n_draws
+            p = self.floor + (1 - self.floor * len(self.models)) * p_best
+            self.current = dict(zip(self.models, (p / p.sum()).tolist()))
+        return self.current
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            model: {
+                "weight": round(self.current[model], 3),
+                "improvements_per_hour": round(
+                    float(3600 * self.improvements[i] / self.seconds[i]), 3
+                ),
+            }
+            for i, model in enumerate(self.models)
+        }
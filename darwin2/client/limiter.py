@@ -0,0 +1,147 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+
+class AIMDLimiter:
+    """Adaptive concurrency limit for one model on one endpoint
+
+    The limit grows additively (by about one per `limit` successful requests) while
+    the smoothed latency stays within `latency_tolerance` times the baseline, i.e. the
+    lowest smoothed latency seen, which is what the server does without queueing.
+    When latency rises past that point or a request fails, the limit is cut
+    multiplicatively by `backoff`. Only one cut happens per round of requests, so one
+    burst of slow responses doesn't collapse the limit.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        latency_tolerance: float = 2.0,
+        backoff: float = 0.5,
+        latency_alpha: float = 0.2,
+    ) -> None:
+        self.limit: float = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.latency_alpha = latency_alpha
+        self.in_flight: int = 0
+        self.smoothed: float | None = None
+        self.baseline: float | None = None
+        # Responses to ignore before the limit can be cut again
+        self.cooldown: int = 0
+
+    def has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def record(self, latency: float | None) -> None:
+        """Record a finished request, `latency` is None if it failed"""
+        if self.cooldown:
+            self.cooldown -= 1
+
+        if latency is None:
+            self.__decrease()
+            return
+
+        if self.smoothed is None:
+            self.smoothed = latency
+        else:
+            self.smoothed += self.latency_alpha * (latency - self.smoothed)
+        if self.baseline is None or self.smoothed < self.baseline:
+            self.baseline = self.smoothed
+        else:
+            # Let the baseline follow slow drifts (e.g. longer programs in the prompts)
+            self.baseline += 0.01 * (self.smoothed - self.baseline)
+
+        if self.smoothed > self.latency_tolerance * self.baseline:
+            self.__decrease()
+        elif self.in_flight >= int(self.limit):
+            # Only grow when the current limit is actually being used
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def __decrease(self) -> None:
+        if self.cooldown:
+            return
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        self.cooldown = max(int(self.limit), 1)
+
+
+class ConcurrencyLimits:
+    """AIMD limiters for every (endpoint, model) pair"""
+
+    def __init__(
+        self,
+        initial_limit: int = 4,
+        max_limit: int = 32,
+        latency_tolerance: float = 2.0,
+        backoff: float = 0.5,
+    ) -> None:
+        self.initial_limit = initial_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.limiters: Dict[Tuple[str, str], AIMDLimiter] = {}
+        self.__released = asyncio.Event()
+
+    def limiter(self, endpoint: str, model: str) -> AIMDLimiter:
+        key = (endpoint, model)
+        if key not in self.limiters:
+            self.limiters[key] = AIMDLimiter(
+                initial_limit=self.initial_limit,
+                max_limit=self.max_limit,
+                latency_tolerance=self.latency_tolerance,
+                backoff=self.backoff,
+            )
+        return self.limiters[key]
+
+    def available(self, endpoints: List[str], model: str) -> List[str]:
+        return [e for e in endpoints if self.limiter(e, model).has_capacity()]
+
+    async def wait_for_release(self) -> None:
+        self.__released.clear()
+        await self.__released.wait()
+
+    def acquire(self, endpoint: str, model: str) -> None:
+        self.limiter(endpoint, model).in_flight += 1
+
+    def release(self, endpoint: str, model: str) -> None:
+        self.limiter(endpoint, model).in_flight -= 1
+        self.__released.set()
+
+    @contextmanager
+    def track(self, endpoint: str, model: str) -> Iterator["LatencyTimer"]:
+        """Time a request inside the with block and feed it to the limiter
+
+        The timer can be stopped early (e.g. at the first streamed token) to measure
+        queueing + prefill rather than the whole generation.
+        """
+        timer = LatencyTimer()
+        try:
+            yield timer
+        except Exception:
+            self.limiter(endpoint, model).record(None)
+            raise
+        else:
+            self.limiter(endpoint, model).record(timer.stop())
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            f"{endpoint} {model}": round(limiter.limit, 2)
+            for (endpoint, model), limiter in self.limiters.items()
+        }
+
+
+class LatencyTimer:
+    def __init__(self) -> None:
+        self.start = time.monotonic()
+        self.latency: float | None = None
+
+    def stop(self) -> float:
+        if self.latency is None:
+            self.latency = time.monotonic() - self.start
+        return self.latency
@@ -95,3 +95,27 @@ ISLAND_ID: {}
             )
         except Exception as e:
             print(f"Could not log: {e}")
+
+    def timed_out_sample(self, sample: Sample) -> None:
+        template = """
+-------
+TIME: {}
+SCORE: TIMEOUT
+ISLAND_ID: {}
+-------
+{}
+
+############################################################
+
+"""
+
+        try:
+            self.samples_file.write(
+                template.format(
+                    datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+                    sample.island_id,
+                    sample.code,
+                )
+            )
+        except Exception as e:
+            print(f"Could not log: {e}")
@@ -1,21 +1,28 @@
 import ast
-import json
+import asyncio
+import hashlib
 import pickle
 import time
-from collections import deque
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
-from multiprocessing import Manager, Queue
-from typing import Any, Deque, Dict, List, Tuple
+from contextlib import aclosing
+from typing import Any, Dict, List, Tuple
 
 import numpy as np
-import requests
 
+from darwin2.client.balancer import EndpointSelector
+from darwin2.client.bandit import ModelBandit
+from darwin2.client.limiter import ConcurrencyLimits
 from darwin2.client.logger_v2 import Logger
+from darwin2.client.prefix import PrefixReuse
+from darwin2.client.queues import WatermarkQueue
+from darwin2.client.sessions import SessionPool
 from darwin2.configuration.ollama import OllamaConfig
-from darwin2.evaluating.evaluator import Evaluator
+from darwin2.evaluating.cache import EvaluationCache
+from darwin2.evaluating.evaluator import BROKEN_POOL, FILTERED, TIMEOUT, Evaluation
+from darwin2.evaluating.pool import EvaluatorPool
 from darwin2.evolving.evolver import Evolver
 from darwin2.evolving.samples import Sample
-from darwin2.postprocessing.parser import RegExParser
+from darwin2.postprocessing.parser import RegExParser, StreamWatcher
+from darwin2.postprocessing.validation import Preflight
 
 
 class OllamaClient:
@@ -29,7 +36,15 @@ class OllamaClient:
         self.endpoints = endpoints
         self.corrector_endpoints = corrector_endpoints or endpoints
         self.config = config
-        self.evaluator = Evaluator()
+        # Routes samplers and correctors to the least loaded healthy endpoint
+        self.selector = EndpointSelector(
+            list(dict.fromkeys(self.endpoints + self.corrector_endpoints)),
+            config.failure_threshold,
+            config.circuit_cooldown,
+            config.latency_alpha,
+        )
+        # Learns which sampler models improve the islands fastest
+        self.bandit = ModelBandit(config.samplers, config.model_mix_floor)
 
         if database_save:
             with open(database_save, "rb") as f:
@@ -42,16 +57,22 @@ class OllamaClient:
         spec: str,
         evolve_function_name: str,
         solve_function_name: str,
-        inputs: Tuple[Any, ...],
+        inputs: Tuple[Any, ...] | List[Tuple[Any, ...]],
         log_base_path: str,
     ):
         self.log = Logger(base_path=log_base_path)
         """Start the evolution process
 
-        This function creates the thread pools for the samplers, evaluators, and correctors, and starts the infinite evolution process.
+        This function creates the evaluator pool and starts the infinite evolution process.
+
+        `inputs` are the arguments of the solve function, or a list of them to evaluate
+        every program on several inputs in parallel.
 
         """
         self.spec = spec
+        self.inputs = [inputs] if isinstance(inputs, tuple) else list(inputs)
+        self.evolve_function_name = evolve_function_name
+        self.solve_function_name = solve_function_name
         self.base_evolve_function, self.solve_function = self.__parse_spec(
             self.spec, evolve_function_name, solve_function_name
         )
@@ -59,159 +80,410 @@ class OllamaClient:
             f"Parsed base_evolve_function and solve_function\nBase Evolve Function:\n{self.base_evolve_function}\nSolve Function:\n{self.solve_function}"
         )
 
-        # Spawn samplers
-        self.samplers = ThreadPoolExecutor(max_workers=self.config.n_samplers)
+        self.cache = EvaluationCache(
+            hashlib.sha256(
+                f"{self.spec}\n{self.inputs}\n{solve_function_name}\n{self.config.evaluation_timeout}\n{self.config.evaluation_cpu_limit}\n{self.config.evaluation_memory_limit}".encode()
+            ).hexdigest(),
+            evolve_function_name,
+            self.config.evaluation_cache_path,
+        )
+        self.preflight = Preflight(self.spec, evolve_function_name)
+        # Evaluations in flight, so duplicates wait for them instead of running again
+        self.pending_evaluations: Dict[str, asyncio.Future] = {}
 
-        if self.config.n_correctors:
-            # Spawn correctors
-            self.correctors = ThreadPoolExecutor(max_workers=self.config.n_correctors)
-        # Spawn evaluators
-        self.evaluators = ProcessPoolExecutor(max_workers=self.config.n_evaluators)
+        # Spawn evaluators. Every worker loads the spec once, so it isn't sent (and
+        # re-executed) with every sample
+        self.evaluators = EvaluatorPool(
+            self.config.n_evaluators,
+            self.spec,
+            evolve_function_name,
+            self.config.evaluation_timeout,
+            self.config.evaluation_cpu_limit,
+            self.config.evaluation_memory_limit,
+            self.config.max_tasks_per_evaluator,
+        )
 
-        samples_queue: Deque[Sample] = deque()
-        corrections_queue: Deque[Sample] = deque()
+        try:
+            asyncio.run(self.__evolve())
+        except KeyboardInterrupt:
+            self.evolver.save_database()
+            self.log.log_misc("KeyboardInterrupt")
+            exit()
 
-        # TODO: Change to deque if processpool really does not work
-        scores_queue = Manager().Queue()
+    async def __evolve(self):
+        """Run the evolution pipeline on the event loop
 
-        # Register base evolve function and score in all islands
-        self.evaluators.submit(
-            self.evaluator.eval,
-            scores_queue,
-            self.spec,
-            Sample(self.base_evolve_function, -1),
-            inputs,
-            solve_function_name,
-            evolve_function_name,
+        Every stage is a set of worker coroutines connected by asyncio queues. Samplers
+        and correctors await their HTTP requests directly, evaluators hand their work to
+        the process pool, and every worker is woken up as soon as the result (or the
+        next item in its queue) is available, so nothing busy-waits.
+
+        samplers -> samples_queue -> evaluators -> scores_queue -> coordinator
+        coordinator -> corrections_queue -> correctors -> samples_queue
+
+        Every queue is bounded by the watermarks in the config, so a slow stage pauses
+        the stages that feed it instead of letting work pile up.
+        """
+        # Samples waiting to be evaluated (from samplers and correctors)
+        self.samples_queue = WatermarkQueue(*self.config.sample_watermarks)
+        # Samples that scored 0 and are waiting to be corrected
+        self.corrections_queue = WatermarkQueue(*self.config.correct_watermarks)
+        # Scored samples waiting to be registered
+        self.scores_queue = WatermarkQueue(*self.config.evaluate_watermarks)
+        # Keep-alive connections shared by samplers and correctors
+        self.sessions = SessionPool(
+            self.config.connections_per_endpoint,
+            self.config.keepalive_timeout,
+            self.config.request_timeout,
+            self.config.connect_timeout,
+        )
+        # Adaptive concurrency limit for every endpoint and model
+        self.limits = ConcurrencyLimits(
+            self.config.initial_concurrency,
+            self.config.max_concurrency,
+            self.config.latency_tolerance,
+            self.config.concurrency_backoff,
         )
-        sample = scores_queue.get(block=True)
+        self.prefix_reuse = PrefixReuse(self.config.initial_concurrency)
+        # Streamed completions that were cut short
+        self.n_early_stops = 0
+        self.n_echoes = 0
+
+        # Register base evolve function and score in all islands
+        sample = await self.__evaluate(Sample(self.base_evolve_function, -1))
         self.log.log_misc(f"Scored base_evolve_function: {sample.score}")
         self.evolver.populate_islands(sample)
 
         # Start infinite evolution loop
         self.log.log_misc("Starting evolution loop")
-        n_sample_tasks = 0
+        workers = [self.__coordinator(), self.__reporter(), self.__health_checker()]
+        workers += [self.__sampler_worker() for _ in range(self.config.n_samplers)]
+        workers += [self.__evaluator_worker() for _ in range(self.config.n_evaluators)]
+        if self.config.n_correctors > 0 and self.config.correctors:
+            workers += [
+                self.__corrector_worker() for _ in range(self.config.n_correctors)
+            ]
         try:
-            while True:
-                if n_sample_tasks < 100:
-                    sample = self.__get_prompt_and_island_id()
-                    self.samplers.submit(
-                        self.__sample,
-                        samples_queue,
-                        np.random.choice(self.endpoints, 1)[0],
-                        sample,
-                        self.__yield_weighted_model_name(self.config.samplers),
-                    )
+            await asyncio.gather(*workers)
+        finally:
+            await self.sessions.close()
+
+    async def __evaluate(self, sample: Sample) -> Sample:
+        if not self.config.evaluation_cache:
+            evaluation = await self.__run_evaluation(sample.code, sample.island_id)
+            sample.score, sample.scores = evaluation.score, evaluation.scores
+            return sample
+
+        key = self.cache.key(sample.code)
+        if key is None:
+            # Doesn't parse, no need to bother a worker with it
+            sample.score = 0
+            return sample
+
+        evaluation = self.cache.get(key)
+        if evaluation is None and key in self.pending_evaluations:
+            # Shielded so that cancelling this waiter doesn't cancel the evaluation
+            evaluation = await asyncio.shield(self.pending_evaluations[key])
+        if evaluation is None:
+            future = asyncio.get_running_loop().create_future()
+            self.pending_evaluations[key] = future
+            try:
+                evaluation = await self.__run_evaluation(sample.code, sample.island_id)
+                # Only deterministic outcomes are cached: timeouts and broken pools
+                # depend on the load, and whether a sample makes the cascade's cut
+                # depends on its island
+                if evaluation.error not in (TIMEOUT, BROKEN_POOL, FILTERED):
+                    self.cache.put(key, evaluation)
+            finally:
+                # Still None if the evaluation failed, waiters then run their own
+                future.set_result(evaluation)
+                del self.pending_evaluations[key]
+        sample.score, sample.scores = evaluation.score, evaluation.scores
+        return sample
 
-                # Pass sample to correctors if needed
-                if samples_queue:
-                    sample = samples_queue.popleft()
+    async def __run_evaluation(self, code: str, island_id: int) -> Evaluation:
+        thresholds = self.__cascade_thresholds(island_id)
+        if thresholds is not None:
+            return await self.evaluators.evaluate_cascade(
+                code,
+                self.inputs,
+                thresholds,
+                self.solve_function_name,
+                self.evolve_function_name,
+            )
+        # Only the code goes to the workers and only the scores come back. Every input
+        # is evaluated on its own worker
+        return await self.evaluators.evaluate_all(
+            code, self.inputs, self.solve_function_name, self.evolve_function_name
+        )
+
+    def __cascade_thresholds(self, island_id: int) -> Tuple[float, ...] | None:
+        # None (evaluate on everything) until the island has fully evaluated programs
+        if (
+            not self.config.cascade_evaluation
+            or len(self.inputs) < 2
+            or not 0 <= island_id < len(self.evolver.islands)
+        ):
+            return None
+        return self.evolver.islands[island_id].thresholds(
+            len(self.inputs), self.config.cascade_quantile
+        )
+
+    def __filtered(self, sample: Sample) -> bool:
+        # Cascade evaluations stop early, so the sample doesn't have every score
+        return sample.scores is not None and len(sample.scores) < len(self.inputs)
+
+    async def __sampler_worker(self):
+        while True:
+            # Wait before building the prompt so it is not stale by the time an LLM
+            # sees it
+            await self.samples_queue.wait_until_accepting()
+            model = self.__yield_weighted_model_name(self.__sampler_mix())
+            prompt, examples = self.__get_prompt_and_island_id()
+            endpoint = await self.__acquire_endpoint(
+                self.endpoints, model, prompt.island_id
+            )
+            try:
+                # Completions are requested one after the other from the same server
+                # and model, so every one after the first reuses the cached prompt
+                # prefill
+                for _ in range(self.config.completions_per_prompt):
+                    start = time.monotonic()
+                    sample = await self.__sample(endpoint, prompt, model, examples)
+                    self.bandit.record_time(model, time.monotonic() - start)
+                    if sample is None:
+                        continue
                     sample.code = RegExParser.parse(sample.code)
                     self.log.log_misc("Received sample")
-                    # Must send to evaluators instead
-                    self.evaluators.submit(
-                        self.evaluator.eval,
-                        scores_queue,
-                        spec,
-                        sample,
-                        inputs,
-                        solve_function_name,
-                        evolve_function_name,
-                    )
-                    n_sample_tasks -= 1
-
-                if not scores_queue.empty():
-                    sample = scores_queue.get()
-                    self.log.log_misc("Scored sample")
-                    if (
-                        sample.score == 0
-                        and self.config.n_correctors > 0
-                        and self.config.correctors
-                    ):
-                        self.correctors.submit(
-                            self.__correct_sample,
-                            corrections_queue,
-                            np.random.choice(self.corrector_endpoints, 1)[0],
-                            sample,
-                            self.__yield_weighted_model_name(self.config.correctors),
-                        )
-                    elif sample.score != 0:
-                        self.log.scored_sample(sample)
-                        self.evolver.register_sample(sample, [sample.score])
-
-                if corrections_queue:
-                    correction = corrections_queue.popleft()
-                    self.log.log_misc("Received corrected sample")
-                    self.log.log_sample(correction)
-                    self.evaluators.submit(
-                        self.evaluator.eval,
-                        scores_queue,
-                        spec,
-                        correction,
-                        inputs,
-                        solve_function_name,
-                        evolve_function_name,
-                    )
+                    # Every completion waits for room, not just the first
+                    await self.samples_queue.put(sample)
+            finally:
+                self.limits.release(endpoint, model)
 
-                time.sleep(0.01)
-        except KeyboardInterrupt:
-            self.evolver.save_database()
-            self.log.log_misc("KeyboardInterrupt")
-            exit()
+    async def __evaluator_worker(self):
+        while True:
+            sample = await self.samples_queue.get()
+            if self.config.preflight and (reason := self.preflight.check(sample.code)):
+                # Scored 0 without an evaluator, so the coordinator sends it on to
+                # the correctors like any other broken sample
+                self.log.log_misc(f"Sample failed preflight: {reason}")
+                sample.score, sample.scores = 0, None
+                await self.scores_queue.put(sample)
+                continue
+            await self.scores_queue.put(await self.__evaluate(sample))
+
+    async def __corrector_worker(self):
+        while True:
+            sample = await self.corrections_queue.get()
+            model = self.__yield_weighted_model_name(self.config.correctors)
+            endpoint = await self.__acquire_endpoint(self.corrector_endpoints, model)
+            try:
+                correction = await self.__correct_sample(endpoint, sample, model)
+            finally:
+                self.limits.release(endpoint, model)
+            self.log.log_misc("Received corrected sample")
+            self.log.log_sample(correction)
+            await self.__wait_for_correction_room()
+            self.samples_queue.put_nowait(correction)
+
+    async def __wait_for_correction_room(self):
+        # Wait for room in samples_queue like the samplers do, unless the corrections
+        # queue is full: the coordinator may then be waiting on us and the evaluators
+        # on the coordinator, so waiting could deadlock the pipeline. samples_queue
+        # only goes past its high watermark in that case.
+        while not (
+            self.samples_queue.is_accepting()
+            or not self.corrections_queue.is_accepting()
+        ):
+            room = asyncio.ensure_future(self.samples_queue.wait_until_accepting())
+            backlog = asyncio.ensure_future(self.corrections_queue.wait_until_full())
+            try:
+                await asyncio.wait(
+                    {room, backlog}, return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                room.cancel()
+                backlog.cancel()
+
+    async def __coordinator(self):
+        while True:
+            sample = await self.scores_queue.get()
+            if sample.score is None:
+                self.log.log_misc("Sample timed out")
+                self.log.timed_out_sample(sample)
+                continue
+            if self.__filtered(sample):
+                self.log.log_misc("Sample filtered by the evaluation cascade")
+                continue
+            self.log.log_misc("Scored sample")
+            if (
+                sample.score == 0
+                and self.config.n_correctors > 0
+                and self.config.correctors
+            ):
+                await self.corrections_queue.put(sample)
+            elif sample.score != 0:
+                self.log.scored_sample(sample)
+                if sample.model and self.evolver.improves_island(sample):
+                    self.bandit.record_improvement(sample.model)
+                self.evolver.register_sample(sample, list(sample.signature))
+
+    async def __reporter(self):
+        while True:
+            await asyncio.sleep(self.config.report_period)
+            self.log.log_misc(f"Pipeline stats: {self.stats()}")
+
+    async def __acquire_endpoint(
+        self, candidates: List[str], model: str, island_id: int | None = None
+    ) -> str:
+        """Take a concurrency slot for `model` on the best endpoint that has one free
+
+        With island affinity, prompts of an island go to the island's preferred
+        endpoint while it has capacity, so they hit the prefix cache left there by
+        the island's previous prompts. Otherwise the least loaded endpoint is used.
+        """
+        while True:
+            available = self.limits.available(
+                self.selector.healthy(candidates) or candidates, model
+            )
+            if available:
+                break
+            await self.limits.wait_for_release()
+        if self.config.island_affinity and island_id is not None:
+            endpoint = self.selector.preferred(island_id, available)[0]
+        else:
+            endpoint = self.selector.select(available)
+        self.limits.acquire(endpoint, model)
+        return endpoint
+
+    async def __health_checker(self):
+        while True:
+            await asyncio.sleep(self.config.health_check_period)
+            for endpoint in self.selector.due_for_probe():
+                healthy = await self.sessions.probe(endpoint)
+                self.selector.probed(endpoint, healthy)
+                if healthy:
+                    self.log.log_misc(f"Re-admitted endpoint {endpoint}")
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Number of items waiting in front of each stage of the pipeline"""
+        return {
+            "samples_queue": self.samples_queue.qsize(),
+            "corrections_queue": self.corrections_queue.qsize(),
+            "scores_queue": self.scores_queue.qsize(),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depths": self.queue_depths(),
+            "early_stops": self.n_early_stops,
+            "echoes": self.n_echoes,
+            "endpoints": self.selector.stats(),
+            "concurrency_limits": self.limits.stats(),
+            "prefix_cache": self.prefix_reuse.stats(),
+            "model_mix": self.bandit.stats(),
+            "evaluation_cache": self.cache.stats(),
+            "database": self.evolver.stats(),
+            "evaluators": self.evaluators.stats(),
+            "preflight": self.preflight.stats(),
+            "cascade_thresholds": {
+                island_id: thresholds[:-1]
+                for island_id in range(len(self.evolver.islands))
+                if (thresholds := self.__cascade_thresholds(island_id)) is not None
+            },
+        }
+
+    def __sampler_mix(self) -> Dict[str, float]:
+        if self.config.adaptive_model_mix:
+            return self.bandit.weights()
+        return self.config.samplers
 
     def __yield_weighted_model_name(self, model_distribution: Dict[str, float]) -> str:
         return np.random.choice(
             list(model_distribution.keys()), 1, p=list(model_distribution.values())
         )[0]
 
-    def __sample(
-        self, samples_queue: Deque[Sample], endpoint: str, sample: Sample, model: str
-    ):
-        try:
-            response = requests.post(
-                endpoint,
-                data=json.dumps(
-                    {"prompt": sample.code, "model": model, "stream": False}
-                ),
-            ).json()["response"]
-            samples_queue.append(Sample(response, sample.island_id))
-        except:
-            # If sample failed, return the base evolve function that was implemented in the spec
-            samples_queue.append(
-                Sample(
-                    self.base_evolve_function,
-                    sample.island_id,
+    async def __generate(
+        self, endpoint: str, prompt: str, model: str, examples: List[str] | None = None
+    ) -> str | None:
+        """Get a completion from an Ollama server
+
+        When streaming, generation is cut off once the completion holds everything the
+        parser needs. Returns None if the model was only echoing one of the `examples`.
+        """
+        reuse = self.prefix_reuse.record(endpoint, model, prompt)
+        if not self.config.streaming:
+            with self.selector.track(endpoint), self.limits.track(
+                endpoint, model
+            ) as timer:
+                response = (
+                    await self.sessions.post(
+                        endpoint, {"prompt": prompt, "model": model, "stream": False}
+                    )
+                )["response"]
+            self.prefix_reuse.record_latency(reuse, timer.stop())
+            return response
+
+        watcher = StreamWatcher(examples, self.evolve_function_name)
+        with self.selector.track(endpoint), self.limits.track(endpoint, model) as timer:
+            async with aclosing(
+                self.sessions.stream(
+                    endpoint, {"prompt": prompt, "model": model, "stream": True}
                 )
-            )
+            ) as chunks:
+                async for chunk in chunks:
+                    # Time to first token is the queueing + prefill latency the
+                    # limiter cares about, the rest depends on the output length
+                    timer.stop()
+                    if watcher.feed(chunk.get("response", "")):
+                        self.n_early_stops += 1
+                        break
+                    if chunk.get("done"):
+                        break
+        self.prefix_reuse.record_latency(reuse, timer.stop())
 
-    def __correct_sample(
-        self,
-        corrections_queue: Deque[Sample],
-        endpoint: str,
-        sample: Sample,
-        model: str,
-    ):
+        if watcher.echoed:
+            self.n_echoes += 1
+            return None
+        return watcher.text
+
+    async def __sample(
+        self, endpoint: str, sample: Sample, model: str, examples: List[str]
+    ) -> Sample | None:
+        try:
+            response = await self.__generate(endpoint, sample.code, model, examples)
+        except Exception as e:
+            # Dropped rather than replaced with the base evolve function, which would
+            # only fill the islands with copies of it
+            self.log.log_misc(f"Sample request to {endpoint} failed: {e!r}")
+            return None
+        if response is None:
+            self.log.log_misc("Dropped sample echoing a prompt example")
+            return None
+        return Sample(response, sample.island_id, model=model)
+
+    async def __correct_sample(
+        self, endpoint: str, sample: Sample, model: str
+    ) -> Sample:
         prompt_aug = f"Correct this code to the best of your ability. Fix any module-specific code like calls to nonexistent functions, improper data types, etc. Do not modify the parameters that the main function defines. If the code is fine as is, simply output the code in a markdown code block.\n\n {sample.code}"
         try:
-            response = requests.post(
-                endpoint,
-                data=json.dumps(
-                    {"prompt": prompt_aug, "model": model, "stream": False}
-                ),
-            ).json()["response"]
-            sample.code = RegExParser.parse(response)
-            corrections_queue.append(Sample(sample.code, sample.island_id))
-        except:
+            response = await self.__generate(endpoint, prompt_aug, model)
+            return Sample(
+                RegExParser.parse(response), sample.island_id, model=sample.model
+            )
+        except Exception:
             # If correction failed, return original sample
-            corrections_queue.append(sample)
+            return sample
 
-    def __get_prompt_and_island_id(self) -> Sample:
-        prompt = "Below are older versions of the function. You are to use these versions to help you improve the function given your understanding of the function's job."
+    def __get_prompt_and_island_id(self) -> Tuple[Sample, List[str]]:
+        # The instructions never change, so they go first and the examples last. That
+        # way every prompt shares the instructions (and prompts of the same island
+        # often the first examples too) with the server's prefix cache.
+        prompt = "Below are older versions of the function. You are to use these versions to help you improve the function given your understanding of the function's job. Generate an improved function. Format your response in markdown syntax with a python code block containing the improved function. Do not modify the function's parameters.\n"
         samples, island_id = self.evolver.get_samples()
         for i in samples:
-            prompt += "\n" + i
-        prompt += "Generate an improved function. Format your response in markdown syntax with a python code block containing the improved function. Do not modify the function's parameters."
-        return Sample(prompt, island_id)
+            prompt += "\n" + i + "\n"
+        return Sample(prompt, island_id), samples
 
     def __parse_spec(
         self, spec: str, evolve_function_name: str, solve_function_name: str
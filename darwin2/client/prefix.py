@@ -0,0 +1,51 @@
+from collections import deque
+from os.path import commonprefix
+from typing import Deque, Dict, List, Tuple
+
+
+class PrefixReuse:
+    """Estimates how much of each prompt an endpoint can serve from its prefix cache
+
+    The last `history` prompts sent to every (endpoint, model) pair are kept, roughly
+    one per parallel slot on the server. The reused part of a new prompt is its
+    longest common prefix with any of them. Latencies are split into warm (at least
+    half of the prompt reused) and cold requests, to check that reuse actually cuts
+    time to first token.
+    """
+
+    def __init__(self, history: int = 4) -> None:
+        self.history = history
+        self.recent: Dict[Tuple[str, str], Deque[str]] = {}
+        self.reused_chars: int = 0
+        self.total_chars: int = 0
+        # [sum of latencies, number of requests]
+        self.latencies: Dict[str, List[float]] = {"warm": [0.0, 0], "cold": [0.0, 0]}
+
+    def record(self, endpoint: str, model: str, prompt: str) -> float:
+        """Register a prompt sent to `endpoint` and return the fraction reused"""
+        recent = self.recent.setdefault((endpoint, model), deque(maxlen=self.history))
+        reused = max((len(commonprefix([prompt, p])) for p in recent), default=0)
+        recent.append(prompt)
+        self.reused_chars += reused
+        self.total_chars += len(prompt)
+        return reused / len(prompt) if prompt else 0.0
+
+    def record_latency(self, reuse: float, latency: float) -> None:
+        totals = self.latencies["warm" if reuse >= 0.5 else "cold"]
+        totals[0] += latency
+        totals[1] += 1
+
+    def stats(self) -> Dict[str, float | None]:
+        return {
+            "reuse_rate": (
+                round(self.reused_chars / self.total_chars, 3)
+                if self.total_chars
+                else None
+            ),
+            "warm_latency": self.__mean("warm"),
+            "cold_latency": self.__mean("cold"),
+        }
+
+    def __mean(self, kind: str) -> float | None:
+        total, n = self.latencies[kind]
+        return round(total / n, 3) if n else None
@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any
+
+
+class WatermarkQueue(asyncio.Queue):
+    """An asyncio queue that applies backpressure with high/low watermarks
+
+    Once the queue holds `high_watermark` items, `put` (and `wait_until_accepting`)
+    block until consumers drain it back down to `low_watermark`. The gap between the
+    two stops producers from waking up for every single item that gets consumed.
+
+    `put_nowait` never blocks and ignores the watermarks. It is meant for stages that
+    feed back into an earlier queue (e.g. correctors), where waiting could deadlock
+    the pipeline. Those can check `is_accepting` first, and `wait_until_full` tells
+    them when the queue they drain is backed up.
+    """
+
+    def __init__(self, high_watermark: int, low_watermark: int) -> None:
+        super().__init__()
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.__accepting = asyncio.Event()
+        self.__accepting.set()
+        # Always the opposite of __accepting
+        self.__full = asyncio.Event()
+
+    async def wait_until_accepting(self) -> None:
+        await self.__accepting.wait()
+
+    async def wait_until_full(self) -> None:
+        await self.__full.wait()
+
+    async def put(self, item: Any) -> None:
+        # Every waiting producer wakes up at the low watermark, the ones after the
+        # queue is full again go back to waiting
+        while not self.__accepting.is_set():
+            await self.__accepting.wait()
+        self.put_nowait(item)
+
+    def put_nowait(self, item: Any) -> None:
+        super().put_nowait(item)
+        if self.qsize() >= self.high_watermark:
+            self.__accepting.clear()
+            self.__full.set()
+
+    def get_nowait(self) -> Any:
+        item = super().get_nowait()
+        if self.qsize() <= self.low_watermark:
+            self.__accepting.set()
+            self.__full.clear()
+        return item
+
+    def is_accepting(self) -> bool:
+        return self.__accepting.is_set()
@@ -0,0 +1,87 @@
+import json
+from typing import Any, AsyncIterator, Dict
+from urllib.parse import urlsplit
+
+import aiohttp
+
+
+class SessionPool:
+    """Keep-alive HTTP sessions shared by everything that talks to an LLM server
+
+    One `aiohttp.ClientSession` is kept per endpoint origin (scheme://host:port), so
+    samplers and correctors hitting the same server reuse its pooled connections
+    instead of paying for a new TCP handshake on every request.
+
+    Sessions are created lazily and must be used from the event loop that created them.
+    """
+
+    def __init__(
+        self,
+        connections_per_endpoint: int = 16,
+        keepalive_timeout: float = 60.0,
+        request_timeout: float = 600.0,
+        connect_timeout: float = 10.0,
+    ) -> None:
+        self.connections_per_endpoint = connections_per_endpoint
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(
+            total=request_timeout, connect=connect_timeout
+        )
+        self.sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    def session(self, endpoint: str) -> aiohttp.ClientSession:
+        origin = self.origin(endpoint)
+        session = self.sessions.get(origin)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.connections_per_endpoint,
+                    keepalive_timeout=self.keepalive_timeout,
+                ),
+                timeout=self.timeout,
+            )
+            self.sessions[origin] = session
+        return session
+
+    async def post(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        async with self.session(endpoint).post(
+            endpoint, data=json.dumps(payload)
+        ) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def stream(
+        self, endpoint: str, payload: Dict[str, Any]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the JSON objects of a newline-delimited streaming response
+
+        Closing the generator early drops the connection, which makes the server stop
+        generating.
+        """
+        async with self.session(endpoint).post(
+            endpoint, data=json.dumps(payload)
+        ) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                if line.strip():
+                    yield json.loads(line)
+
+    async def probe(self, endpoint: str) -> bool:
+        """Health check: is the server behind `endpoint` answering at all?"""
+        try:
+            async with self.session(endpoint).get(
+                self.origin(endpoint),
+                timeout=aiohttp.ClientTimeout(total=self.timeout.connect),
+            ) as response:
+                return response.status == 200
+        except Exception:
+            return False
+
+    def origin(self, endpoint: str) -> str:
+        url = urlsplit(endpoint)
+        return f"{url.scheme}://{url.netloc}"
+
+    async def close(self) -> None:
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions.clear()
@@ -1,3 +1,7 @@
+from darwin2.evolving.buckets import ScoreBuckets
+from darwin2.evolving.eviction import EVICTION_POLICIES
+
+
 class EvolveConfig:
     def __init__(
         self,
@@ -9,7 +13,40 @@ class EvolveConfig:
         init_temperature: float = 0.1,
         temperature_period: int = 200,
         examples_per_prompt: int = 2,
+        max_programs_per_island: int | None = None,
+        eviction_policy: str = "longest",
+        compress_programs: bool = False,
+        score_buckets: str | None = None,
+        bucket_width: float = 1.0,
+        n_buckets: int = 32,
     ) -> None:
+        # max_versions bounds the samples kept per cluster and max_programs_per_island
+        # the samples kept per island (None for no bound). Samples over either bound
+        # are evicted according to eviction_policy, one of "longest", "oldest" or
+        # "least_diverse" (see darwin2.evolving.eviction). compress_programs keeps the
+        # code of samples that weren't used in a while zlib-compressed.
+        #
+        # score_buckets clusters samples by buckets of scores instead of exact scores:
+        # "width" (bucket_width wide), "log" (bucket_width decades wide) or "rank"
+        # (n_buckets quantiles), see darwin2.evolving.buckets. None keeps exact scores.
+        if max_versions <= 0:
+            raise ValueError("Argument `max_versions` must be positive")
+        if max_programs_per_island is not None and max_programs_per_island <= 0:
+            raise ValueError("Argument `max_programs_per_island` must be positive")
+        if eviction_policy not in EVICTION_POLICIES:
+            raise ValueError(
+                f"Argument `eviction_policy` must be one of {list(EVICTION_POLICIES)}"
+            )
+
+        if score_buckets is not None and score_buckets not in ScoreBuckets.MODES:
+            raise ValueError(
+                f"Argument `score_buckets` must be None or one of {list(ScoreBuckets.MODES)}"
+            )
+        if bucket_width <= 0:
+            raise ValueError("Argument `bucket_width` must be positive")
+        if n_buckets <= 0:
+            raise ValueError("Argument `n_buckets` must be positive")
+
         self.num_islands: int = num_islands
         self.reset_period: int = reset_period
         self.proportion_to_reset: float = proportion_to_reset
@@ -18,3 +55,9 @@ class EvolveConfig:
         self.init_temperature: float = init_temperature
         self.temperature_period: int = temperature_period
         self.examples_per_prompt: int = examples_per_prompt
+        self.max_programs_per_island: int | None = max_programs_per_island
+        self.eviction_policy: str = eviction_policy
+        self.compress_programs: bool = compress_programs
+        self.score_buckets: str | None = score_buckets
+        self.bucket_width: float = bucket_width
+        self.n_buckets: int = n_buckets
@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, Tuple
 from darwin2.configuration.evolve import EvolveConfig
 
 
@@ -15,7 +15,9 @@ class OllamaConfig:
       samplers = {"llama3:7b": 0.5, "deepseek-coder:6.7b-instruct": 0.5}
 
     n_samplers: int = 4 (Default)
-    - The total number of samplers for the evolution.
+    - The total number of samplers for the evolution. This caps the number of
+      concurrent sample requests across all endpoints, while the adaptive limits
+      below decide how many of them each endpoint gets.
 
     n_correctors: int (Optional)
     - The total number of models used to correct the samples generated by the
@@ -34,6 +36,129 @@ class OllamaConfig:
     - A bunch of evolution-related configuration options. If None, Darwin will use
       a base config that should work just fine.
 
+    evaluation_timeout: float (Optional)
+    - Seconds of wall-clock time a single evaluation may take. Evaluations that
+      run out of time are logged as timed out instead of scored. A worker that
+      doesn't stop in time is killed and replaced.
+
+    evaluation_cpu_limit: int (Optional)
+    - Seconds of CPU time a single evaluation may take, counted like a timeout.
+
+    evaluation_memory_limit: int (Optional)
+    - Address space limit of every evaluator worker, in bytes (e.g. 8 * 1024**3).
+      Programs allocating past it fail with a MemoryError instead of taking down
+      the node.
+
+    max_tasks_per_evaluator: int (Optional)
+    - Replace each evaluator worker with a fresh process after this many
+      evaluations, releasing any memory the evaluated programs leaked.
+
+    preflight: bool = True (Default)
+    - Check samples statically before evaluating them: they have to parse, define
+      exactly one function with the evolved function's parameters and not use
+      names that exist neither in the sample nor in the spec. Samples that fail are
+      sent to the correctors (or dropped if there are none) without taking up an
+      evaluator.
+
+    cascade_evaluation: bool = False (Default)
+    - With several inputs, evaluate them one at a time in the order given (put the
+      cheap ones first) and only move on to the next input if the sample scores at
+      least the island's threshold on the current one. Samples that don't make it
+      are dropped.
+
+    cascade_quantile: float = 0.5 (Default)
+    - The threshold of every cascade stage is this quantile of the scores of the
+      target island's clusters on that stage's input.
+
+    evaluation_cache: bool = True (Default)
+    - Reuse the score of programs that were already evaluated when a sample only
+      differs from one in formatting, comments, docstrings or the function's name.
+
+    evaluation_cache_path: str (Optional)
+    - Directory to persist the evaluation cache in (with diskcache), so it survives
+      across runs. If None, the cache only lives in memory.
+
+    completions_per_prompt: int = 1 (Default)
+    - Number of completions requested for every prompt. Each completion becomes its
+      own sample for the prompt's island, and all of them are sent to the same
+      server so the prompt prefill is only paid once.
+
+    adaptive_model_mix: bool = False (Default)
+    - Reweight `samplers` at runtime with Thompson sampling on the number of island
+      improvements each model produces per second of LLM time. The proportions given
+      in `samplers` are only used until the first results come in.
+
+    model_mix_floor: float = 0.05 (Default)
+    - Minimum proportion every sampler model keeps when `adaptive_model_mix` is on,
+      so that all models keep being explored.
+
+    sample_watermarks: Tuple[int, int] = (64, 16) (Default)
+    - (high, low) watermarks for the queue of samples waiting to be evaluated. Once
+      the queue reaches `high`, samplers stop building new prompts until the
+      evaluators drain it down to `low`.
+
+    correct_watermarks: Tuple[int, int] = (32, 8) (Default)
+    - (high, low) watermarks for the queue of samples waiting to be corrected.
+
+    evaluate_watermarks: Tuple[int, int] = (64, 16) (Default)
+    - (high, low) watermarks for the queue of scored samples waiting to be
+      registered in the evolver. Evaluators pause when it is full.
+
+    connections_per_endpoint: int = 16 (Default)
+    - Maximum number of pooled keep-alive connections to each Ollama server.
+
+    keepalive_timeout: float = 60.0 (Default)
+    - Seconds an idle pooled connection is kept open.
+
+    request_timeout: float = 600.0 (Default)
+    - Seconds before a single LLM request is abandoned.
+
+    connect_timeout: float = 10.0 (Default)
+    - Seconds allowed to establish a connection to an Ollama server.
+
+    failure_threshold: int = 3 (Default)
+    - Consecutive failed requests after which an endpoint is ejected from routing.
+
+    circuit_cooldown: float = 30.0 (Default)
+    - Seconds an ejected endpoint waits before it is health checked and, if it
+      answers, re-admitted.
+
+    latency_alpha: float = 0.2 (Default)
+    - Smoothing factor of the moving average of each endpoint's latency that is used
+      to route requests. Higher values react faster to changes.
+
+    health_check_period: float = 10.0 (Default)
+    - Seconds between two rounds of health checks of ejected endpoints.
+
+    island_affinity: bool = True (Default)
+    - Send the prompts of each island to the same preferred endpoint (consistent
+      hashing) while it has capacity, so they reuse its prompt prefix cache.
+
+    initial_concurrency: int = 4 (Default)
+    - Starting number of concurrent requests allowed for each model on each
+      endpoint. The limit then adapts (AIMD): it grows while the endpoint's latency
+      stays flat and is cut when latency rises or requests fail.
+
+    max_concurrency: int = 32 (Default)
+    - Upper bound for the adaptive per endpoint and model concurrency limit.
+
+    latency_tolerance: float = 2.0 (Default)
+    - How many times its no-load latency an endpoint may take before its
+      concurrency limit is cut.
+
+    concurrency_backoff: float = 0.5 (Default)
+    - Factor the concurrency limit is multiplied by when it is cut.
+
+    streaming: bool = False (Default)
+    - Stream completions from Ollama and stop generation as soon as a complete code
+      block with a function has arrived. Samples whose function is one of the
+      prompt's examples (up to names, docstrings, comments and formatting) are
+      dropped.
+
+    report_period: int = 60 (Default)
+    - Seconds between two pipeline statistics reports (queue depths etc.) in the
+      misc log.
+
     """
 
     def __init__(
@@ -44,6 +169,36 @@ class OllamaConfig:
         correctors: Dict[str, float] | None = None,
         n_evaluators: int = 10,
         evolve_config: EvolveConfig | None = None,
+        evaluation_timeout: float | None = None,
+        evaluation_cpu_limit: int | None = None,
+        evaluation_memory_limit: int | None = None,
+        max_tasks_per_evaluator: int | None = None,
+        preflight: bool = True,
+        cascade_evaluation: bool = False,
+        cascade_quantile: float = 0.5,
+        evaluation_cache: bool = True,
+        evaluation_cache_path: str | None = None,
+        completions_per_prompt: int = 1,
+        adaptive_model_mix: bool = False,
+        model_mix_floor: float = 0.05,
+        sample_watermarks: Tuple[int, int] = (64, 16),
+        correct_watermarks: Tuple[int, int] = (32, 8),
+        evaluate_watermarks: Tuple[int, int] = (64, 16),
+        connections_per_endpoint: int = 16,
+        keepalive_timeout: float = 60.0,
+        request_timeout: float = 600.0,
+        connect_timeout: float = 10.0,
+        failure_threshold: int = 3,
+        circuit_cooldown: float = 30.0,
+        latency_alpha: float = 0.2,
+        health_check_period: float = 10.0,
+        island_affinity: bool = True,
+        initial_concurrency: int = 4,
+        max_concurrency: int = 32,
+        latency_tolerance: float = 2.0,
+        concurrency_backoff: float = 0.5,
+        streaming: bool = False,
+        report_period: int = 60,
     ) -> None:
         # Argument checks
 
@@ -67,12 +222,109 @@ class OllamaConfig:
         if n_evaluators <= 0:
             raise ValueError("Argument `n_evaluators` must be positive")
 
+        for name, value in (
+            ("evaluation_timeout", evaluation_timeout),
+            ("evaluation_cpu_limit", evaluation_cpu_limit),
+            ("evaluation_memory_limit", evaluation_memory_limit),
+            ("max_tasks_per_evaluator", max_tasks_per_evaluator),
+        ):
+            if value is not None and value <= 0:
+                raise ValueError(f"Argument `{name}` must be positive")
+
+        if not 0 <= cascade_quantile <= 1:
+            raise ValueError("Argument `cascade_quantile` must be between 0 and 1")
+
+        if completions_per_prompt <= 0:
+            raise ValueError("Argument `completions_per_prompt` must be positive")
+
+        if model_mix_floor < 0 or model_mix_floor * len(samplers) > 1:
+            raise ValueError(
+                "Argument `model_mix_floor` must be non-negative and at most 1 / len(samplers)"
+            )
+
+        for name, watermarks in (
+            ("sample_watermarks", sample_watermarks),
+            ("correct_watermarks", correct_watermarks),
+            ("evaluate_watermarks", evaluate_watermarks),
+        ):
+            if not self.__valid_watermarks(watermarks):
+                raise ValueError(
+                    f"Argument `{name}` must be a (high, low) tuple with high > low >= 0"
+                )
+
+        if connections_per_endpoint <= 0:
+            raise ValueError("Argument `connections_per_endpoint` must be positive")
+
+        if keepalive_timeout < 0:
+            raise ValueError("Argument `keepalive_timeout` cannot be negative")
+
+        if request_timeout <= 0 or connect_timeout <= 0:
+            raise ValueError(
+                "Arguments `request_timeout` and `connect_timeout` must be positive"
+            )
+
+        if failure_threshold <= 0:
+            raise ValueError("Argument `failure_threshold` must be positive")
+
+        if circuit_cooldown < 0:
+            raise ValueError("Argument `circuit_cooldown` cannot be negative")
+
+        if not 0 < latency_alpha <= 1:
+            raise ValueError("Argument `latency_alpha` must be in (0, 1]")
+
+        if health_check_period <= 0:
+            raise ValueError("Argument `health_check_period` must be positive")
+
+        if not 0 < initial_concurrency <= max_concurrency:
+            raise ValueError(
+                "Argument `initial_concurrency` must be positive and at most `max_concurrency`"
+            )
+
+        if latency_tolerance <= 1:
+            raise ValueError("Argument `latency_tolerance` must be greater than 1")
+
+        if not 0 < concurrency_backoff < 1:
+            raise ValueError("Argument `concurrency_backoff` must be in (0, 1)")
+
+        if report_period <= 0:
+            raise ValueError("Argument `report_period` must be positive")
+
         self.samplers = samplers
         self.n_samplers = n_samplers
         self.n_correctors = n_correctors
         self.correctors = correctors
         self.n_evaluators = n_evaluators
         self.evolve_config = evolve_config or EvolveConfig()
+        self.evaluation_timeout = evaluation_timeout
+        self.evaluation_cpu_limit = evaluation_cpu_limit
+        self.evaluation_memory_limit = evaluation_memory_limit
+        self.max_tasks_per_evaluator = max_tasks_per_evaluator
+        self.preflight = preflight
+        self.cascade_evaluation = cascade_evaluation
+        self.cascade_quantile = cascade_quantile
+        self.evaluation_cache = evaluation_cache
+        self.evaluation_cache_path = evaluation_cache_path
+        self.completions_per_prompt = completions_per_prompt
+        self.adaptive_model_mix = adaptive_model_mix
+        self.model_mix_floor = model_mix_floor
+        self.sample_watermarks = sample_watermarks
+        self.correct_watermarks = correct_watermarks
+        self.evaluate_watermarks = evaluate_watermarks
+        self.connections_per_endpoint = connections_per_endpoint
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        self.failure_threshold = failure_threshold
+        self.circuit_cooldown = circuit_cooldown
+        self.latency_alpha = latency_alpha
+        self.health_check_period = health_check_period
+        self.island_affinity = island_affinity
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_tolerance = latency_tolerance
+        self.concurrency_backoff = concurrency_backoff
+        self.streaming = streaming
+        self.report_period = report_period
 
     def __distribution_sums_to_1(self, dist: Dict[str, float]) -> bool:
         # To avoid decimal imprecision errors. "private" method
@@ -82,3 +334,7 @@ class OllamaConfig:
             sum += int(i * 1000)
 
         return sum == 1000
+
+    def __valid_watermarks(self, watermarks: Tuple[int, int]) -> bool:
+        high, low = watermarks
+        return high > low >= 0
@@ -0,0 +1,58 @@
+import hashlib
+from typing import Any, Dict
+
+from diskcache import Cache
+
+from darwin2.evaluating.evaluator import Evaluation, Evaluator
+
+
+class EvaluationCache:
+    """Evaluations keyed by a hash of the program's normalized source
+
+    LLMs often return programs that only differ from earlier ones in formatting,
+    comments, docstrings or the function's name (see `Evaluator.normalize`), or that
+    copy one of the prompt's examples. Those get the cached evaluation instead of
+    being evaluated again.
+
+    `context` should identify everything else the score depends on (spec, inputs,
+    solve function) so that a persistent cache can be shared between runs.
+
+    The cache assumes evaluations are deterministic.
+    """
+
+    def __init__(
+        self, context: str, base_function_name: str, path: str | None = None
+    ) -> None:
+        self.context = context
+        self.base_function_name = base_function_name
+        # Persisted on disk when given a path, in memory otherwise
+        self.evaluations: Dict[str, Evaluation] | Cache = Cache(path) if path else {}
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def key(self, code: str) -> str | None:
+        """None if the code doesn't parse"""
+        normalized = Evaluator.normalize(code, self.base_function_name)
+        if normalized is None:
+            return None
+        return hashlib.sha256(f"{self.context}\n{normalized}".encode()).hexdigest()
+
+    def get(self, key: str) -> Evaluation | None:
+        evaluation = self.evaluations.get(key)
+        if evaluation is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return evaluation
+
+    def put(self, key: str, evaluation: Evaluation) -> None:
+        self.evaluations[key] = evaluation
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "size": len(self.evaluations),
+        }
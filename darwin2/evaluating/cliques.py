@@ -0,0 +1,54 @@
+from typing import List, Sequence
+
+import numpy as np
+
+
+def adjacency_rows(matrix: np.ndarray) -> List[int]:
+    """Rows of an adjacency matrix as bitsets (bit j of row i set if i and j are adjacent)
+
+    Anything nonzero counts as an edge. The diagonal is ignored, self loops are never
+    part of a clique.
+    """
+    adjacent = np.asarray(matrix) != 0
+    np.fill_diagonal(adjacent, False)
+    packed = np.packbits(adjacent, axis=1, bitorder="little")
+    return [int.from_bytes(row.tobytes(), "little") for row in packed]
+
+
+def count_cliques(rows: Sequence[int], size: int, limit: int | None = None) -> int:
+    """Number of cliques of exactly `size` vertices in the graph given by `rows`
+
+    `rows` are adjacency bitsets like the ones `adjacency_rows` returns. Every clique is
+    found once, from its lowest vertex, by intersecting the candidate set with one
+    adjacency row per vertex added.
+
+    If `limit` is given, counting stops as soon as the count exceeds it and the count
+    so far (which is then larger than `limit`) is returned. Specs use it to give up on
+    colourings that are already worse than anything they'd keep.
+    """
+    if size <= 0:
+        return 1
+    return _count(rows, (1 << len(rows)) - 1, size, limit)
+
+
+def _count(rows: Sequence[int], candidates: int, size: int, limit: int | None) -> int:
+    if size == 1:
+        return candidates.bit_count()
+
+    count = 0
+    while candidates:
+        lowest = candidates & -candidates
+        vertex = lowest.bit_length() - 1
+        candidates ^= lowest
+        # Not enough vertices left to finish a clique
+        if candidates.bit_count() < size - 1:
+            break
+        count += _count(
+            rows,
+            rows[vertex] & candidates,
+            size - 1,
+            None if limit is None else limit - count,
+        )
+        if limit is not None and count > limit:
+            break
+    return count
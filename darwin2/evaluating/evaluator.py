@@ -1,14 +1,179 @@
 import ast
+import math
+import resource
+import signal
+import types
+from contextlib import contextmanager
 from multiprocessing.queues import Queue
-from typing import Tuple, Any
+from typing import Any, Dict, Iterator, NamedTuple, Tuple
 
 from darwin2.evolving.samples import Sample
 
+# Error of evaluations that ran out of wall-clock or CPU time
+TIMEOUT = "Timeout"
+# Error of cascade evaluations that stopped early, see `EvaluatorPool.evaluate_cascade`
+FILTERED = "Filtered"
+# Error of evaluations whose workers kept dying, see `EvaluatorPool.evaluate`
+BROKEN_POOL = "BrokenProcessPool"
+
+
+class Evaluation(NamedTuple):
+    """What an evaluator worker sends back: the score and, if the program failed, the
+    name of the exception. The sample's code is never sent back.
+
+    Timed out evaluations have no score and TIMEOUT as their error. Evaluations over
+    several inputs also carry the score on every input (see `EvaluatorPool.evaluate_all`).
+    """
+
+    score: Any
+    error: str | None = None
+    scores: Tuple[Any, ...] | None = None
+
+
+class EvaluationTimeout(BaseException):
+    # Not an Exception so that a `try: ... except Exception` in the evolved function
+    # can't swallow it
+    pass
+
+
+# Namespace of the spec without the evolved function, built once per evaluator worker
+# process by `Evaluator.initialize`. Samples never run in it directly, see
+# `Evaluator.sample_namespace`
+_spec_namespace: Dict[str, Any] | None = None
+# (wall-clock seconds, CPU seconds) every evaluation in this worker may take
+_limits: Tuple[float | None, int | None] = (None, None)
+
 
 class Evaluator:
     def __init__(self) -> None:
         pass
 
+    @staticmethod
+    def initialize(
+        spec: str,
+        base_function_name: str,
+        timeout: float | None = None,
+        cpu_limit: int | None = None,
+        memory_limit: int | None = None,
+    ) -> None:
+        """Process pool initializer: run the spec (minus the evolved function) once
+
+        Imports, constants and helper functions of the spec stay loaded in the worker,
+        so `score_warm` only has to compile and bind each sample's function.
+
+        Every `score_warm` call in the worker is then limited to `timeout` seconds of
+        wall-clock time and `cpu_limit` seconds of CPU time, and the worker's address
+        space to `memory_limit` bytes (allocations past it raise MemoryError).
+        """
+        global _spec_namespace, _limits
+        _spec_namespace = {}
+        exec(Evaluator.remove_function(spec, base_function_name), _spec_namespace)
+
+        _limits = (timeout, cpu_limit)
+        signal.signal(signal.SIGALRM, Evaluator.__time_is_up)
+        signal.signal(signal.SIGXCPU, Evaluator.__time_is_up)
+        if memory_limit:
+            # Set after the spec's imports, which reserve a lot of address space
+            _, hard = resource.getrlimit(resource.RLIMIT_AS)
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+
+    @staticmethod
+    def sample_namespace(base: Dict[str, Any]) -> Dict[str, Any]:
+        """Fresh namespace for a single sample, layered over the spec's namespace
+
+        Imports, constants and everything else the spec defined are shared, but the
+        spec's functions are rebound to the new namespace so that they call the
+        sample's version of the evolved function. Whatever the sample defines or
+        assigns only lives in the new namespace and goes away with it.
+        """
+        namespace = dict(base)
+        for name, value in base.items():
+            if isinstance(value, types.FunctionType) and value.__globals__ is base:
+                function = types.FunctionType(
+                    value.__code__,
+                    namespace,
+                    value.__name__,
+                    value.__defaults__,
+                    value.__closure__,
+                )
+                function.__kwdefaults__ = value.__kwdefaults__
+                function.__dict__.update(value.__dict__)
+                namespace[name] = function
+        return namespace
+
+    @staticmethod
+    def __time_is_up(signum, frame):
+        raise EvaluationTimeout()
+
+    @staticmethod
+    @contextmanager
+    def __limited(timeout: float | None, cpu_limit: int | None) -> Iterator[None]:
+        if cpu_limit:
+            # RLIMIT_CPU counts the whole life of the process, so move it up to what
+            # has been used so far. Rounded up, so every sample gets at least the full
+            # budget whatever the worker ran before it
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            resource.setrlimit(
+                resource.RLIMIT_CPU,
+                (math.ceil(usage.ru_utime + usage.ru_stime) + cpu_limit, hard),
+            )
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            yield
+        finally:
+            if timeout:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+            if cpu_limit:
+                resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+    @staticmethod
+    def remove_function(spec: str, base_function_name: str) -> str:
+        tree = ast.parse(spec)
+
+        class FunctionRemover(ast.NodeTransformer):
+            def visit_FunctionDef(self, node):
+                if node.name == base_function_name:
+                    return None
+                return node
+
+        return ast.unparse(FunctionRemover().visit(tree))
+
+    def score_warm(
+        self,
+        code: str,
+        inputs: Tuple[Any, ...],
+        function: str,
+        base_function_name: str,
+    ) -> Evaluation:
+        """Like `score`, but reuses the spec loaded by `initialize` in this worker"""
+        if _spec_namespace is None:
+            raise RuntimeError(
+                "Evaluator.score_warm called in a process that wasn't initialized with Evaluator.initialize"
+            )
+        namespace = self.sample_namespace(_spec_namespace)
+        try:
+            with self.__limited(*_limits):
+                exec(
+                    compile(
+                        self.__rename_function(code, base_function_name),
+                        "<sample>",
+                        "exec",
+                    ),
+                    namespace,
+                )
+                return Evaluation(namespace[function](*inputs))
+        except EvaluationTimeout:
+            return Evaluation(None, TIMEOUT)
+        except Exception as e:
+            return Evaluation(0, type(e).__name__)
+        finally:
+            # The rebound functions reference the namespace and the namespace
+            # references them. Clearing it breaks the cycle so everything the sample
+            # allocated is freed now rather than whenever the cyclic GC gets to it
+            namespace.clear()
+
     def eval(
         self,
         scores_queue: Queue,
@@ -18,27 +183,78 @@ class Evaluator:
         function: str,
         base_function_name: str,
     ):
+        evaluation = self.score(spec, sample.code, inputs, function, base_function_name)
+        scores_queue.put(
+            Sample(sample.code, sample.island_id, evaluation.score, sample.model),
+            block=False,
+        )
+
+    def score(
+        self,
+        spec: str,
+        code: str,
+        inputs: Tuple[Any, ...],
+        function: str,
+        base_function_name: str,
+    ) -> Evaluation:
+        """Evaluate a program and return a compact record of its score
+
+        Meant to be the result of an executor future: only the score travels back to
+        the parent process, which still holds the sample itself.
+        """
         spec = self.__reformat_spec(
             spec,
-            sample.code,
+            code,
             base_function_name,
         )
-        global_dict = globals()
+        # Fresh namespace every time, so nothing carries over between samples
+        namespace: Dict[str, Any] = {}
         try:
-            exec(spec, global_dict)
-            score = eval(f"{function}{inputs}", global_dict)
-            scores_queue.put(Sample(sample.code, sample.island_id, score), block=False)
+            exec(spec, namespace)
+            return Evaluation(namespace[function](*inputs))
         except Exception as e:
             # print(e)
-            scores_queue.put(Sample(sample.code, sample.island_id, 0), block=False)
+            return Evaluation(0, type(e).__name__)
+        finally:
+            namespace.clear()
 
-    def __rename_function(self, sample: str, base_function_name: str):
+    @staticmethod
+    def normalize(sample: str, base_function_name: str) -> str | None:
+        """Canonical source of a sample, or None if it doesn't parse
+
+        Functions are renamed like they are for evaluation, docstrings are dropped and
+        unparsing does away with comments and formatting, so programs that only
+        differ in those have the same normalized source.
+        """
         try:
             tree = ast.parse(sample)
-            for node in ast.walk(tree):
-                if isinstance(node, ast.FunctionDef):
-                    node.name = base_function_name
+        except SyntaxError:
+            return None
+        Evaluator.__rename_functions(tree, base_function_name)
+        for node in ast.walk(tree):
+            if isinstance(
+                node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Module)
+            ):
+                body = node.body
+                if (
+                    body
+                    and isinstance(body[0], ast.Expr)
+                    and isinstance(body[0].value, ast.Constant)
+                    and isinstance(body[0].value.value, str)
+                ):
+                    node.body = body[1:] or [ast.Pass()]
+        return ast.unparse(tree)
+
+    @staticmethod
+    def __rename_functions(tree: ast.AST, base_function_name: str) -> None:
+        for node in ast.walk(tree):
+            if isinstance(node, ast.FunctionDef):
+                node.name = base_function_name
 
+    def __rename_function(self, sample: str, base_function_name: str):
+        try:
+            tree = ast.parse(sample)
+            self.__rename_functions(tree, base_function_name)
             return ast.unparse(tree)
         except:
             return sample
@@ -46,16 +262,7 @@ class Evaluator:
     def __reformat_spec(self, spec: str, sample: str, base_function_name: str):
         sample = self.__rename_function(sample, base_function_name)
         try:
-            tree = ast.parse(spec)
-
-            class FunctionRemover(ast.NodeTransformer):
-                def visit_FunctionDef(self, node):
-                    if node.name == base_function_name:
-                        return None
-                    return node
-
-            remover = FunctionRemover()
-            removed_spec = ast.unparse(remover.visit(tree))
+            removed_spec = self.remove_function(spec, base_function_name)
             removed_spec += f"\n{sample}"
             return removed_spec
         except:
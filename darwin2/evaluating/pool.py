@@ -0,0 +1,221 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Tuple
+
+from darwin2.evaluating.evaluator import (
+    BROKEN_POOL,
+    FILTERED,
+    TIMEOUT,
+    Evaluation,
+    Evaluator,
+)
+
+
+class EvaluatorPool:
+    """Process pool of warm evaluators that survives runaway programs
+
+    Workers are initialized with the spec and the per-evaluation limits (see
+    `Evaluator.initialize`), and replaced after `max_tasks_per_worker` evaluations to
+    shed whatever memory evaluated programs leaked.
+
+    Timeouts are enforced inside the worker. If a worker doesn't come back
+    `KILL_GRACE` seconds after its timeout (e.g. it is stuck in C code that never
+    checks for signals), the whole pool is killed and replaced, and the evaluations
+    that were running on it are submitted again.
+    """
+
+    KILL_GRACE = 10.0
+
+    def __init__(
+        self,
+        n_workers: int,
+        spec: str,
+        base_function_name: str,
+        timeout: float | None = None,
+        cpu_limit: int | None = None,
+        memory_limit: int | None = None,
+        max_tasks_per_worker: int | None = None,
+    ) -> None:
+        self.n_workers = n_workers
+        self.initargs = (spec, base_function_name, timeout, cpu_limit, memory_limit)
+        self.timeout = timeout
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.evaluator = Evaluator()
+        self.executor = self.__spawn()
+        # Only as many evaluations as there are workers are handed to the executor,
+        # otherwise time spent queueing would count towards the timeout
+        self.slots = asyncio.Semaphore(n_workers)
+        # Bumped every time the pool is replaced
+        self.generation: int = 0
+        self.n_timeouts: int = 0
+        self.n_kills: int = 0
+        # Samples that reached / were filtered at every cascade stage
+        self.n_reached: List[int] = []
+        self.n_filtered: List[int] = []
+
+    def __spawn(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            initializer=Evaluator.initialize,
+            initargs=self.initargs,
+            max_tasks_per_child=self.max_tasks_per_worker,
+        )
+
+    async def evaluate(
+        self, code: str, inputs: Tuple[Any, ...], function: str, base_function_name: str
+    ) -> Evaluation:
+        async with self.slots:
+            return await self.__evaluate(code, inputs, function, base_function_name)
+
+    async def evaluate_all(
+        self,
+        code: str,
+        inputs: List[Tuple[Any, ...]],
+        function: str,
+        base_function_name: str,
+    ) -> Evaluation:
+        """Evaluate a program on every input in parallel
+
+        The score is the mean over the inputs and `scores` holds the score on every
+        input, in order. If any input times out the whole evaluation counts as timed
+        out, otherwise the error is the first one any input raised.
+        """
+        evaluations = await asyncio.gather(
+            *[
+                self.evaluate(code, input, function, base_function_name)
+                for input in inputs
+            ]
+        )
+        if any(e.error == TIMEOUT for e in evaluations):
+            return Evaluation(None, TIMEOUT)
+        scores = tuple(e.score for e in evaluations)
+        error = next((e.error for e in evaluations if e.error is not None), None)
+        try:
+            score = sum(scores) / len(scores) if len(scores) > 1 else scores[0]
+        except TypeError:
+            # Something that isn't a number came back
+            return Evaluation(0, TypeError.__name__, tuple(0 for _ in scores))
+        return Evaluation(score, error, scores)
+
+    async def evaluate_cascade(
+        self,
+        code: str,
+        inputs: List[Tuple[Any, ...]],
+        thresholds: Tuple[float, ...],
+        function: str,
+        base_function_name: str,
+    ) -> Evaluation:
+        """Evaluate a program on one input after another, as long as it's promising
+
+        After every input but the last, the program has to score at least that
+        input's threshold to move on to the next one. Programs that fail on the first
+        input are treated like failed programs (score 0), programs that don't make a
+        later cut come back with FILTERED as their error and the scores they got so
+        far. Otherwise the result is the same as `evaluate_all`.
+        """
+        if len(self.n_reached) < len(inputs):
+            self.n_reached += [0] * (len(inputs) - len(self.n_reached))
+            self.n_filtered += [0] * (len(inputs) - len(self.n_filtered))
+
+        scores = []
+        error = None
+        for stage, input in enumerate(inputs):
+            self.n_reached[stage] += 1
+            evaluation = await self.evaluate(code, input, function, base_function_name)
+            if evaluation.error == TIMEOUT:
+                return Evaluation(None, TIMEOUT)
+            if evaluation.error is not None and stage == 0:
+                return Evaluation(0, evaluation.error, tuple(0 for _ in inputs))
+            scores.append(evaluation.score)
+            error = error or evaluation.error
+            if stage < len(inputs) - 1 and not evaluation.score >= thresholds[stage]:
+                self.n_filtered[stage] += 1
+                return Evaluation(evaluation.score, FILTERED, tuple(scores))
+
+        try:
+            score = sum(scores) / len(scores) if len(scores) > 1 else scores[0]
+        except TypeError:
+            return Evaluation(0, TypeError.__name__, tuple(0 for _ in scores))
+        return Evaluation(score, error, tuple(scores))
+
+    async def __evaluate(
+        self, code: str, inputs: Tuple[Any, ...], function: str, base_function_name: str
+    ) -> Evaluation:
+        for _ in range(3):
+            generation = self.generation
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                self.evaluator.score_warm,
+                code,
+                inputs,
+                function,
+                base_function_name,
+            )
+            try:
+                if self.timeout is None:
+                    evaluation = await future
+                else:
+                    evaluation = await asyncio.wait_for(
+                        future, self.timeout + self.KILL_GRACE
+                    )
+            except asyncio.TimeoutError:
+                if generation == self.generation:
+                    self.__replace()
+                self.n_kills += 1
+                evaluation = Evaluation(None, TIMEOUT)
+            except BrokenProcessPool:
+                # Killed because of another evaluation (or crashed), try again on the
+                # new pool
+                if generation == self.generation:
+                    self.__replace()
+                continue
+
+            if evaluation.error == TIMEOUT:
+                self.n_timeouts += 1
+            return evaluation
+
+        return Evaluation(0, BROKEN_POOL)
+
+    def __replace(self) -> None:
+        executor = self.executor
+        self.executor = self.__spawn()
+        self.generation += 1
+        # ProcessPoolExecutor can't kill a single worker, so kill them all
+        for process in list((executor._processes or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def __rss(pid: int) -> int | None:
+        # Resident set size in bytes, from procfs so it works on the workers too
+        try:
+            with open(f"/proc/{pid}/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        rss = {
+            pid: self.__rss(pid) for pid in list((self.executor._processes or {}))
+        }
+        stats: Dict[str, Any] = {
+            "timeouts": self.n_timeouts,
+            "killed": self.n_kills,
+            # MB per worker process
+            "worker_rss": {
+                pid: round(size / 2**20, 1)
+                for pid, size in rss.items()
+                if size is not None
+            },
+        }
+        if self.n_reached:
+            stats["cascade_filtered"] = [
+                round(filtered / reached, 3) if reached else 0.0
+                for filtered, reached in zip(self.n_filtered, self.n_reached)
+            ]
+        return stats
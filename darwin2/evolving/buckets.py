@@ -0,0 +1,61 @@
+import bisect
+import math
+import random
+
+
+class ScoreBuckets:
+    """Quantizes signatures so that an island's clusters are keyed by buckets of
+    scores instead of exact scores
+
+    Every score of a signature is bucketed on its own:
+    - "width": floor(score / width)
+    - "log": sign(score) * (floor(log10(1 + |score|) / width) + 1), so `width` is in
+      decades and wide ranges (negated clique counts) get a few buckets per order of
+      magnitude. Zero gets a bucket of its own, so positive and negative scores never
+      share one
+    - "rank": which of `n_buckets` quantiles of the scores seen so far the score falls
+      in, estimated from a reservoir of at most RESERVOIR scores per input. Bounds the
+      number of clusters whatever the spec returns.
+    """
+
+    MODES = ("width", "log", "rank")
+    RESERVOIR = 4096
+
+    def __init__(self, mode: str, width: float = 1.0, n_buckets: int = 32) -> None:
+        self.mode = mode
+        self.width = width
+        self.n_buckets = n_buckets
+        # Sorted reservoir of scores per input, and how many scores each has seen
+        self.seen: list[list[float]] = []
+        self.n_seen: list[int] = []
+
+    def key(self, signature: tuple) -> tuple:
+        return tuple(self.__bucket(i, score) for i, score in enumerate(signature))
+
+    def __bucket(self, i: int, score) -> int | float:
+        score = float(score)
+        if not math.isfinite(score):
+            return score
+        if self.mode == "width":
+            return math.floor(score / self.width)
+        if self.mode == "log":
+            if score == 0:
+                return 0
+            magnitude = math.floor(math.log10(1 + abs(score)) / self.width)
+            return int(math.copysign(magnitude + 1, score))
+        return self.__rank(i, score)
+
+    def __rank(self, i: int, score: float) -> int:
+        while len(self.seen) <= i:
+            self.seen.append([])
+            self.n_seen.append(0)
+        seen = self.seen[i]
+        self.n_seen[i] += 1
+        if len(seen) < self.RESERVOIR:
+            bisect.insort(seen, score)
+        elif random.random() < self.RESERVOIR / self.n_seen[i]:
+            # Reservoir sampling, so the quantiles follow every score seen
+            seen.pop(random.randrange(len(seen)))
+            bisect.insort(seen, score)
+        rank = bisect.bisect_left(seen, score) / len(seen)
+        return min(int(rank * self.n_buckets), self.n_buckets - 1)
@@ -1,21 +1,64 @@
-import numpy as np
-from scipy.special import softmax
+import math
 
-from darwin2.evolving.samples import Sample
+from darwin2.evolving.programs import ProgramRecord
+from darwin2.evolving.sampling import FenwickTree
 
 
 class Cluster:
-    def __init__(self, sample: Sample) -> None:
+    # Holds records of the samples, their code is in the island's ProgramStore. With
+    # score buckets the samples of a cluster can have different scores, the cluster's
+    # score and signature are those of its best sample.
+    def __init__(self, sample: ProgramRecord) -> None:
         self.score: int = sample.score
-        self.samples: list[Sample] = [sample]
-        self.lengths: list[int] = [len(sample.code)]
+        self.signature: tuple = self.__signature(sample)
+        self.samples: list[ProgramRecord] = [sample]
+        self.lengths: list[int] = [sample.length]
+        self.__build_weights()
 
-    def register_sample(self, sample: Sample) -> None:
+    def __setstate__(self, state: dict) -> None:
+        # Clusters pickled before the weights (or signature) were kept don't have them
+        self.__dict__.update(state)
+        if "weights" not in state:
+            self.__build_weights()
+        if "signature" not in state:
+            self.signature = (self.score,)
+
+    @staticmethod
+    def __signature(sample: ProgramRecord) -> tuple:
+        return sample.scores if sample.scores is not None else (sample.score,)
+
+    def __build_weights(self) -> None:
+        # Shorter samples are more likely: softmax of -(length - min) / max, where
+        # the min only shifts every logit so it cancels out. The max is cached and the
+        # weights only rebuilt when it changes.
+        self.max_length: int = max(self.lengths)
+        self.weights = FenwickTree([self.__weight(l) for l in self.lengths])
+
+    def __weight(self, length: int) -> float:
+        return math.exp(-length / (self.max_length or 1))
+
+    def register_sample(self, sample: ProgramRecord) -> None:
         self.samples.append(sample)
-        self.lengths.append(len(sample.code))
+        self.lengths.append(sample.length)
+        if sample.score > self.score:
+            self.score, self.signature = sample.score, self.__signature(sample)
+        if self.lengths[-1] > self.max_length:
+            self.__build_weights()
+        else:
+            self.weights.append(self.__weight(self.lengths[-1]))
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def remove(self, index: int) -> ProgramRecord:
+        sample = self.samples.pop(index)
+        self.lengths.pop(index)
+        # Clusters are small, rebuilding keeps the samples in registration order
+        if self.samples:
+            self.__build_weights()
+            best = max(self.samples, key=lambda s: s.score)
+            self.score, self.signature = best.score, self.__signature(best)
+        return sample
 
-    def get_sample(self) -> Sample:
-        normalized = (np.array(self.lengths) - min(self.lengths)) / (
-            max(self.lengths) or 1
-        )
-        return np.random.choice(self.samples, p=softmax(-normalized))
+    def get_sample(self) -> ProgramRecord:
+        return self.samples[self.weights.sample()]
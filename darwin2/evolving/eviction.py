@@ -0,0 +1,68 @@
+import re
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from darwin2.evolving.clusters import Cluster
+from darwin2.evolving.programs import ProgramStore
+
+
+class EvictionPolicy(ABC):
+    """Picks the sample a full cluster gives up
+
+    Subclass it and add an instance to EVICTION_POLICIES to make it available to
+    EvolveConfig.eviction_policy.
+    """
+
+    @abstractmethod
+    def choose(self, cluster: Cluster, programs: ProgramStore) -> int:
+        pass
+
+
+class LongestFirst(EvictionPolicy):
+    # Same score with more code, and the least likely to be shown in a prompt anyway
+    def choose(self, cluster: Cluster, programs: ProgramStore) -> int:
+        return int(np.argmax(cluster.lengths))
+
+
+class OldestFirst(EvictionPolicy):
+    def choose(self, cluster: Cluster, programs: ProgramStore) -> int:
+        return 0
+
+
+class LeastDiverse(EvictionPolicy):
+    """Evicts the sample closest to another one in the cluster
+
+    Closeness is the Jaccard similarity of the samples' sets of tokens. Ties go to the
+    longer sample.
+    """
+
+    TOKEN = re.compile(r"\w+|[^\w\s]")
+
+    def choose(self, cluster: Cluster, programs: ProgramStore) -> int:
+        tokens = [
+            set(self.TOKEN.findall(programs.code(record.program_id)))
+            for record in cluster.samples
+        ]
+        chosen, closest = 0, -1.0
+        for i, a in enumerate(tokens):
+            similarity = max(
+                (
+                    len(a & b) / (len(a | b) or 1)
+                    for j, b in enumerate(tokens)
+                    if j != i
+                ),
+                default=0.0,
+            )
+            if similarity > closest or (
+                similarity == closest and cluster.lengths[i] > cluster.lengths[chosen]
+            ):
+                chosen, closest = i, similarity
+        return chosen
+
+
+EVICTION_POLICIES: dict[str, EvictionPolicy] = {
+    "longest": LongestFirst(),
+    "oldest": OldestFirst(),
+    "least_diverse": LeastDiverse(),
+}
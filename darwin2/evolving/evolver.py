@@ -6,7 +6,9 @@ from scipy.special import softmax
 import random
 import pickle
 
+from darwin2.evolving.buckets import ScoreBuckets
 from darwin2.evolving.islands import Island
+from darwin2.evolving.programs import ProgramStore
 from darwin2.evolving.samples import Sample
 
 # All the config stuff should be made in the config file
@@ -18,6 +20,8 @@ class Evolver:
         self.config: EvolveConfig = config
         self.islands: list[Island] = []
         self.active_islands_ids: set[int] = set()
+        # Every distinct program on any island is kept once, here
+        self.programs = ProgramStore(config.compress_programs)
         for _ in range(self.config.num_islands):
             self.islands.append(
                 Island(
@@ -25,24 +29,93 @@ class Evolver:
                     self.config.init_temperature,
                     self.config.temperature_period,
                     self.config.examples_per_prompt,
+                    self.config.max_programs_per_island,
+                    self.config.eviction_policy,
+                    self.programs,
+                    self.__score_buckets(),
                 )
             )
 
-        self.best_sample_per_island: list[Sample | None] = [None] * config.num_islands
-        self.worst_sample_per_island: list[Sample | None] = [None] * config.num_islands
+        self.__init_bookkeeping()
 
         self.last_reset = time.time()
-        self.migration_counter_per_island: list[int] = [0] * config.num_islands
+        # Evictions on islands that have since been reset
+        self.n_evicted_by_resets: int = 0
+
+    def __init_bookkeeping(self) -> None:
+        # One slot per island, so migrations and resets are a few vectorized ops
+        # instead of rebuilding arrays from lists of samples. Empty islands have a best
+        # score of -inf and a worst score of inf.
+        n = self.config.num_islands
+        self.best_sample_per_island = np.full(n, None, dtype=object)
+        self.worst_sample_per_island = np.full(n, None, dtype=object)
+        self.best_score_per_island = np.full(n, -np.inf)
+        self.worst_score_per_island = np.full(n, np.inf)
+        self.migration_counter_per_island = np.zeros(n, dtype=np.int64)
+        # When the island's best score last improved, breaks ties between resets
+        self.last_improvement_per_island = np.full(n, time.time())
+
+    def __setstate__(self, state: dict) -> None:
+        # Databases pickled by older versions lack the newer attributes
+        state.setdefault("n_evicted_by_resets", 0)
+        self.__dict__.update(state)
+        for name, default in (
+            ("max_programs_per_island", None),
+            ("eviction_policy", "longest"),
+            ("compress_programs", False),
+            ("score_buckets", None),
+            ("bucket_width", 1.0),
+            ("n_buckets", 32),
+        ):
+            if not hasattr(self.config, name):
+                setattr(self.config, name, default)
+        if "best_score_per_island" not in state:
+            # Older databases kept the bookkeeping in lists
+            best, worst = state["best_sample_per_island"], state["worst_sample_per_island"]
+            counters = state["migration_counter_per_island"]
+            self.__init_bookkeeping()
+            for i in range(self.config.num_islands):
+                self.best_sample_per_island[i] = best[i]
+                self.worst_sample_per_island[i] = worst[i]
+                if best[i] is not None:
+                    self.best_score_per_island[i] = best[i].score
+                if worst[i] is not None:
+                    self.worst_score_per_island[i] = worst[i].score
+                self.migration_counter_per_island[i] = counters[i]
+        if "programs" not in state:
+            # Islands of older databases each got their own store when loaded
+            self.programs = ProgramStore(self.config.compress_programs)
+            for island in self.islands:
+                for cluster in island.clusters.values():
+                    cluster.samples = [
+                        self.programs.add(island.programs.sample(record))
+                        for record in cluster.samples
+                    ]
+                island.programs = self.programs
+
+    def __score_buckets(self) -> ScoreBuckets | None:
+        # Every island ranks its own scores
+        if self.config.score_buckets is None:
+            return None
+        return ScoreBuckets(
+            self.config.score_buckets, self.config.bucket_width, self.config.n_buckets
+        )
 
     def populate_islands(self, sample: Sample):
         for id in range(self.config.num_islands):
-            self.register_sample(Sample(sample.code, id, sample.score), [sample.score])
+            self.register_sample(
+                Sample(sample.code, id, sample.score, scores=sample.scores),
+                list(sample.signature),
+            )
 
     def get_samples(self) -> Tuple[list[str], int]:
         island_id = random.choice(list(self.active_islands_ids))
         samples = self.islands[island_id].get_samples()
         return [s.code for s in samples], island_id
 
+    def improves_island(self, sample: Sample) -> bool:
+        return sample.score > self.best_score_per_island[sample.island_id]
+
     # TODO: create alternative register_sample function that registers function
     # into random island
     def register_sample(
@@ -50,36 +123,33 @@ class Evolver:
         sample: Sample,
         scores: list[int],
     ) -> None:
-        # I'm just reducing the scores to equal the last score, we could handle this better
-        # in the future if we wanna be able to handle multiple inputs
-        # i.e. [(7,3,3), (6,3,3), (5,3,3)] - For Trifference Problem
-        score = scores[-1]
+        # `scores` has the score on every input, i.e. [(7,3,3), (6,3,3), (5,3,3)] - For
+        # Trifference Problem. They are the island's cluster key, while the sample's
+        # score (their aggregate) decides the best and worst samples
+        score = sample.score
+        island_id = sample.island_id
 
-        self.islands[sample.island_id].register_sample(sample)
-        self.active_islands_ids.add(sample.island_id)
+        self.islands[island_id].register_sample(sample, tuple(scores))
+        self.active_islands_ids.add(island_id)
 
         # I do this to decide whether to change the worst/best score on the island easily if necessary
-        if (
-            self.best_sample_per_island[sample.island_id] is None
-            or score > self.best_sample_per_island[sample.island_id].score  # type: ignore
-        ):
-            self.best_sample_per_island[sample.island_id] = sample
-            self.migration_counter_per_island[sample.island_id] = 0
-        elif (
-            self.worst_sample_per_island[sample.island_id] is None
-            or score < self.worst_sample_per_island[sample.island_id].score  # type: ignore
-        ):
-            self.worst_sample_per_island[sample.island_id] = sample
-            self.migration_counter_per_island[sample.island_id] += 1
+        if score > self.best_score_per_island[island_id]:
+            self.best_sample_per_island[island_id] = sample
+            self.best_score_per_island[island_id] = score
+            self.last_improvement_per_island[island_id] = time.time()
+            self.migration_counter_per_island[island_id] = 0
         else:
-            self.migration_counter_per_island[sample.island_id] += 1
-
-        if (
-            self.migration_counter_per_island[sample.island_id]
-            >= self.config.migration_rate
-        ):
-            self.migration_counter_per_island[sample.island_id] = 0
-            self.migrate_islands(sample.island_id)
+            if (
+                self.worst_sample_per_island[island_id] is None
+                or score < self.worst_score_per_island[island_id]
+            ):
+                self.worst_sample_per_island[island_id] = sample
+                self.worst_score_per_island[island_id] = score
+            self.migration_counter_per_island[island_id] += 1
+
+        if self.migration_counter_per_island[island_id] >= self.config.migration_rate:
+            self.migration_counter_per_island[island_id] = 0
+            self.migrate_islands(island_id)
 
         if time.time() - self.last_reset > self.config.reset_period:
             self.last_reset = time.time()
@@ -90,40 +160,85 @@ class Evolver:
         num_islands_to_reset = int(
             self.config.num_islands * (1 - self.config.proportion_to_reset)
         )
-        sorted_island_indices = np.argsort(
-            [x.score if x else -float("int") for x in self.best_sample_per_island]
+        # Lowest best score first, and of those the longest without an improvement
+        sorted_island_indices = np.lexsort(
+            (self.last_improvement_per_island, self.best_score_per_island)
         )
         kept_islands = sorted_island_indices[num_islands_to_reset:]
         reset_islands = sorted_island_indices[:num_islands_to_reset]
+        # Founders can only come from kept islands that have a sample
+        kept_islands = kept_islands[np.isfinite(self.best_score_per_island[kept_islands])]
+        if len(kept_islands) == 0:
+            return
+        founder_ids = np.random.choice(kept_islands, len(reset_islands))
+        # Taken before any island is reset, the founders are registered afterwards
+        founders = self.best_sample_per_island[founder_ids]
 
         for idx in reset_islands:
-            self.active_islands_ids.remove(idx)
+            idx = int(idx)
+            self.active_islands_ids.discard(idx)
+            self.n_evicted_by_resets += self.islands[idx].n_evicted
+            # The store is shared, the old island's programs go with its last reference
+            for cluster in self.islands[idx].clusters.values():
+                for record in cluster.samples:
+                    self.programs.release(record)
             self.islands[idx] = Island(
                 self.config.max_versions,
                 self.config.init_temperature,
                 self.config.temperature_period,
                 self.config.examples_per_prompt,
+                self.config.max_programs_per_island,
+                self.config.eviction_policy,
+                self.programs,
+                self.__score_buckets(),
             )
-            self.best_sample_per_island[idx] = None
-            self.worst_sample_per_island[idx] = None
-            founder_id = np.random.choice(kept_islands)
-            founder = self.best_sample_per_island[founder_id]
+        self.best_sample_per_island[reset_islands] = None
+        self.worst_sample_per_island[reset_islands] = None
+        self.best_score_per_island[reset_islands] = -np.inf
+        self.worst_score_per_island[reset_islands] = np.inf
+        self.migration_counter_per_island[reset_islands] = 0
+
+        for idx, founder in zip(reset_islands, founders):
             self.register_sample(
-                Sample(founder.code, idx, founder.score), [founder.score]
+                Sample(founder.code, int(idx), founder.score, scores=founder.scores),
+                list(founder.signature),
             )
 
-    def migrate_islands(self, from_island_id) -> None:
+    def migrate_islands(self, from_island_id: int) -> None:
         """Migrating the worst member of an island to a different island"""
-        best = np.array([i.score for i in self.best_sample_per_island])
-        to_island_id = np.random.choice(self.islands, 1, p=softmax(-best))
         sample = self.worst_sample_per_island[from_island_id]
+        if sample is None:
+            return
+        # Islands with lower best scores are more likely to get the sample. Empty
+        # islands and the island it comes from can't.
+        candidates = np.flatnonzero(np.isfinite(self.best_score_per_island))
+        candidates = candidates[candidates != from_island_id]
+        if len(candidates) == 0:
+            return
+        to_island_id = int(
+            np.random.choice(
+                candidates, p=softmax(-self.best_score_per_island[candidates])
+            )
+        )
+        # Moved, not copied
+        self.islands[from_island_id].remove_sample(sample)
+        self.worst_sample_per_island[from_island_id] = None
+        self.worst_score_per_island[from_island_id] = np.inf
+        self.migration_counter_per_island[from_island_id] = 0
         sample.island_id = to_island_id
         self.register_sample(
             sample,
-            [sample.score],
+            list(sample.signature),
         )
-        self.migration_counter_per_island[from_island_id] = 0
-        # delete from original island?
+
+    def stats(self) -> dict:
+        return {
+            "programs": sum(i.size for i in self.islands),
+            "clusters": sum(len(i.clusters) for i in self.islands),
+            "evicted": sum(i.n_evicted for i in self.islands)
+            + self.n_evicted_by_resets,
+            **self.programs.stats(),
+        }
 
     def save_database(self):
         with open("logs/database.pickle", "wb") as f:
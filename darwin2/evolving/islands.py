@@ -2,7 +2,10 @@ import numpy as np
 from scipy.special import softmax
 
 from darwin2.evolving.samples import Sample
+from darwin2.evolving.buckets import ScoreBuckets
 from darwin2.evolving.clusters import Cluster
+from darwin2.evolving.eviction import EVICTION_POLICIES
+from darwin2.evolving.programs import ProgramStore
 
 
 class Island:
@@ -12,40 +15,181 @@ class Island:
         cluster_temperature: float,
         cluster_temperature_period: int,
         examples_per_prompt: int,
+        max_programs: int | None = None,
+        eviction_policy: str = "longest",
+        programs: ProgramStore | None = None,
+        buckets: ScoreBuckets | None = None,
     ) -> None:
+        # Samples kept per cluster
         self.max_version = max_version
         self.cluster_temperature = cluster_temperature
         self.cluster_temperature_period = cluster_temperature_period
         self.examples_per_prompt = examples_per_prompt
+        # Samples kept on the island, past it the lowest scoring cluster gives one up
+        self.max_programs = max_programs
+        # Name in EVICTION_POLICIES, so islands pickle without the policy
+        self.eviction_policy = eviction_policy
+        # Where the code of the samples is kept, usually shared by all islands
+        self.programs = programs if programs is not None else ProgramStore()
+        # Quantizes signatures into cluster keys, None to key clusters by the exact
+        # signature
+        self.buckets = buckets
 
-        # Right now clusters are just indexed with one score, but we could indexx them
-        # using a tuple of all the scores on all inputs.
-        self.clusters: dict[int, Cluster] = {}
+        # Clusters are indexed by the signature of their samples, the tuple of the
+        # scores on all inputs (or by its bucket)
+        self.clusters: dict[tuple, Cluster] = {}
+        # Samples ever registered (drives the temperature) and samples kept
         self.num_programs: int = 0
+        self.size: int = 0
+        self.n_evicted: int = 0
+        self.__index_clusters()
 
-    def register_sample(self, sample: Sample) -> None:
-        score = sample.score
-        # TODO: Fix
-        if score not in self.clusters:
-            self.clusters[score] = Cluster(sample=sample)
+    def __setstate__(self, state: dict) -> None:
+        # Islands pickled before the cluster index and the bounds were kept don't
+        # have them
+        self.__dict__.update(state)
+        # Clusters used to be keyed by their (int) score
+        self.clusters = {
+            k if isinstance(k, tuple) else (k,): c for k, c in self.clusters.items()
+        }
+        if "positions" not in state:
+            self.__index_clusters()
+        if "size" not in state:
+            self.size = sum(len(c.samples) for c in self.clusters.values())
+            self.n_evicted = 0
+            self.max_programs = None
+            self.eviction_policy = "longest"
+        if "buckets" not in state:
+            self.buckets = None
+        if "programs" not in state:
+            # Clusters used to hold the samples themselves
+            self.programs = ProgramStore()
+            for cluster in self.clusters.values():
+                cluster.samples = [self.programs.add(s) for s in cluster.samples]
+
+    def __index_clusters(self) -> None:
+        # Signatures and scores of the clusters in a fixed order, so the sampling
+        # table doesn't have to be rebuilt from the dict on every prompt
+        self.signatures: list[tuple] = list(self.clusters.keys())
+        self.scores = np.array(
+            [self.clusters[s].score for s in self.signatures], dtype=float
+        )
+        # Cluster key -> its position in signatures and scores
+        self.positions: dict[tuple, int] = {
+            s: position for position, s in enumerate(self.signatures)
+        }
+        # Cumulative softmax of the scores, valid until num_programs (and so the
+        # temperature) or the clusters change
+        self.cumulative: np.ndarray | None = None
+
+    def register_sample(self, sample: Sample, signature: tuple | None = None) -> None:
+        if signature is None:
+            signature = sample.signature
+        if self.buckets is not None:
+            signature = self.buckets.key(signature)
+        record = self.programs.add(sample)
+        if signature not in self.clusters:
+            self.clusters[signature] = Cluster(sample=record)
+            self.positions[signature] = len(self.signatures)
+            self.signatures.append(signature)
+            self.scores = np.append(self.scores, float(sample.score))
         else:
-            self.clusters[score].register_sample(sample)
+            cluster = self.clusters[signature]
+            cluster.register_sample(record)
+            self.scores[self.positions[signature]] = cluster.score
 
         self.num_programs += 1
+        self.size += 1
+        self.cumulative = None
 
-    def get_samples(self) -> list[Sample]:
-        keys = np.array(list(self.clusters.keys()))
-        # TODO: Fix
-        temperature = self.cluster_temperature * (
-            1
-            - (self.num_programs % self.cluster_temperature_period)
-            / self.cluster_temperature_period
+        if len(self.clusters[signature]) > self.max_version:
+            self.__evict(signature)
+        while self.max_programs is not None and self.size > self.max_programs:
+            self.__evict(self.signatures[int(np.argmin(self.scores))])
+
+    def remove_sample(self, sample: Sample) -> bool:
+        """Remove a sample (one with the same code) from the island, if it's here"""
+        program_id = self.programs.find(sample.code)
+        if program_id is None:
+            return False
+        # Most likely in the cluster of its own signature
+        signatures = sorted(
+            self.clusters, key=lambda s: self.clusters[s].signature != sample.signature
+        )
+        for signature in signatures:
+            for index, record in enumerate(self.clusters[signature].samples):
+                if record.program_id == program_id:
+                    self.__remove(signature, index)
+                    return True
+        return False
+
+    def __evict(self, signature: tuple) -> None:
+        cluster = self.clusters[signature]
+        policy = EVICTION_POLICIES[self.eviction_policy]
+        index = policy.choose(cluster, self.programs)
+        if self.buckets is not None:
+            # Samples of a bucket can have different scores, the policy only decides
+            # between the lowest scoring ones so the best sample is never given up
+            scores = [record.score for record in cluster.samples]
+            if scores[index] > min(scores):
+                index = min(
+                    range(len(scores)), key=lambda i: (scores[i], -cluster.lengths[i])
+                )
+        self.__remove(signature, index)
+        self.n_evicted += 1
+
+    def __remove(self, signature: tuple, index: int) -> None:
+        cluster = self.clusters[signature]
+        self.programs.release(cluster.remove(index))
+        self.size -= 1
+        self.cumulative = None
+        position = self.positions[signature]
+        if len(cluster):
+            self.scores[position] = cluster.score
+        else:
+            del self.clusters[signature]
+            self.signatures.pop(position)
+            self.scores = np.delete(self.scores, position)
+            del self.positions[signature]
+            for s in self.signatures[position:]:
+                self.positions[s] -= 1
+
+    def thresholds(self, length: int, quantile: float) -> tuple | None:
+        """Per-input `quantile` of the signatures of this island's clusters
+
+        Only signatures over `length` inputs count. None if there are none yet.
+        """
+        signatures = [
+            c.signature for c in self.clusters.values() if len(c.signature) == length
+        ]
+        if not signatures:
+            return None
+        return tuple(
+            float(t) for t in np.quantile(np.array(signatures, dtype=float), quantile, axis=0)
         )
-        p = softmax(keys / temperature)
+
+    def get_samples(self) -> list[Sample]:
+        if self.cumulative is None:
+            # Clusters are chosen by their (aggregate) score
+            # TODO: Fix
+            temperature = self.cluster_temperature * (
+                1
+                - (self.num_programs % self.cluster_temperature_period)
+                / self.cluster_temperature_period
+            )
+            self.cumulative = np.cumsum(softmax(self.scores / temperature))
 
         n_examples = min(len(self.clusters), self.examples_per_prompt)
-        keys = np.random.choice(keys, size=n_examples, p=p)
-        keys = np.sort(keys)
+        chosen = np.searchsorted(
+            self.cumulative,
+            np.random.random(n_examples) * self.cumulative[-1],
+            side="right",
+        )
+        chosen = np.minimum(chosen, len(self.signatures) - 1)
+        chosen = chosen[np.argsort(self.scores[chosen], kind="stable")]
 
-        implementations = [self.clusters[key].get_sample() for key in keys]
+        implementations = [
+            self.programs.sample(self.clusters[self.signatures[i]].get_sample())
+            for i in chosen
+        ]
         return implementations
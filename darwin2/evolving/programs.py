@@ -0,0 +1,134 @@
+import hashlib
+import zlib
+from collections import OrderedDict
+
+from darwin2.evolving.samples import Sample
+
+
+class ProgramRecord:
+    """What clusters keep per sample: a reference into the ProgramStore instead of
+    the code itself"""
+
+    __slots__ = ("program_id", "score", "length", "island_id", "model", "scores")
+
+    def __init__(
+        self,
+        program_id: int,
+        score,
+        length: int,
+        island_id: int,
+        model: str | None = None,
+        scores: tuple | None = None,
+    ) -> None:
+        self.program_id = program_id
+        self.score = score
+        self.length = length
+        self.island_id = island_id
+        self.model = model
+        self.scores = scores
+
+    def __getstate__(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state: tuple) -> None:
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def __repr__(self) -> str:
+        return f"Island {self.island_id} with score: {self.score}"
+
+
+class ProgramStore:
+    """Content-addressed store that keeps every distinct program once
+
+    Programs are reference counted: every record added holds a reference and the
+    program is dropped with the last one. With `compress`, only the HOT_PROGRAMS most
+    recently used programs are kept as strings, the rest are zlib-compressed until
+    they're needed again.
+    """
+
+    HOT_PROGRAMS = 1024
+
+    def __init__(self, compress: bool = False) -> None:
+        self.compress = compress
+        self.programs: dict[int, str | bytes] = {}
+        self.references: dict[int, int] = {}
+        # Digest of the code -> program id
+        self.ids: dict[bytes, int] = {}
+        self.digests: dict[int, bytes] = {}
+        # Program ids stored uncompressed, least recently used first
+        self.hot: OrderedDict[int, None] = OrderedDict()
+        self.next_id: int = 0
+
+    def __len__(self) -> int:
+        return len(self.programs)
+
+    @staticmethod
+    def __digest(code: str) -> bytes:
+        return hashlib.blake2b(code.encode(), digest_size=16).digest()
+
+    def find(self, code: str) -> int | None:
+        return self.ids.get(self.__digest(code))
+
+    def add(self, sample: Sample) -> ProgramRecord:
+        """Intern the sample's program and return a record referencing it"""
+        digest = self.__digest(sample.code)
+        program_id = self.ids.get(digest)
+        if program_id is None:
+            program_id = self.next_id
+            self.next_id += 1
+            self.ids[digest] = program_id
+            self.digests[program_id] = digest
+            self.programs[program_id] = sample.code
+            self.references[program_id] = 0
+            self.__touch(program_id)
+        self.references[program_id] += 1
+        return ProgramRecord(
+            program_id,
+            sample.score,
+            len(sample.code),
+            sample.island_id,
+            sample.model,
+            sample.scores,
+        )
+
+    def release(self, record: ProgramRecord) -> None:
+        program_id = record.program_id
+        self.references[program_id] -= 1
+        if self.references[program_id] == 0:
+            del self.references[program_id]
+            del self.programs[program_id]
+            del self.ids[self.digests.pop(program_id)]
+            self.hot.pop(program_id, None)
+
+    def code(self, program_id: int) -> str:
+        program = self.programs[program_id]
+        if isinstance(program, bytes):
+            program = zlib.decompress(program).decode()
+            self.programs[program_id] = program
+        self.__touch(program_id)
+        return program
+
+    def sample(self, record: ProgramRecord) -> Sample:
+        return Sample(
+            self.code(record.program_id),
+            record.island_id,
+            record.score,
+            record.model,
+            record.scores,
+        )
+
+    def __touch(self, program_id: int) -> None:
+        if not self.compress:
+            return
+        self.hot[program_id] = None
+        self.hot.move_to_end(program_id)
+        while len(self.hot) > self.HOT_PROGRAMS:
+            cold, _ = self.hot.popitem(last=False)
+            self.programs[cold] = zlib.compress(self.programs[cold].encode())
+
+    def stats(self) -> dict:
+        return {
+            "stored_programs": len(self.programs),
+            "compressed": len(self.programs) - len(self.hot) if self.compress else 0,
+        }
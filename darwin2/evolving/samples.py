@@ -1,8 +1,35 @@
 class Sample:
-    def __init__(self, code: str, island_id: int, score: int = 0) -> None:
+    __slots__ = ("score", "island_id", "code", "model", "scores")
+
+    def __init__(
+        self,
+        code: str,
+        island_id: int,
+        score: int = 0,
+        model: str | None = None,
+        scores: tuple | None = None,
+    ) -> None:
         self.score = score
         self.island_id = island_id
         self.code = code
+        # Name of the LLM that generated the sample
+        self.model = model
+        # Score on every input, `score` aggregates them
+        self.scores = scores
+
+    def __getstate__(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state: dict) -> None:
+        # Samples pickled before they had slots (or model and scores) still load
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **state[1]}
+        for name in self.__slots__:
+            setattr(self, name, state.get(name))
+
+    @property
+    def signature(self) -> tuple:
+        return self.scores if self.scores is not None else (self.score,)
 
     def __repr__(self) -> str:
         return f"Island {self.island_id} with score: {self.score}"
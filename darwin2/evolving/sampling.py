@@ -0,0 +1,72 @@
+import random
+from typing import List, Sequence
+
+
+class FenwickTree:
+    """Weights that can be appended, updated and drawn from in O(log n)
+
+    A binary indexed tree of prefix sums. Drawing walks down the tree to the first
+    index whose prefix sum exceeds a uniform draw, so the probability of every index is
+    its weight over the total.
+    """
+
+    def __init__(self, weights: Sequence[float] = ()) -> None:
+        self.rebuild(weights)
+
+    def __len__(self) -> int:
+        return len(self.weights)
+
+    def rebuild(self, weights: Sequence[float]) -> None:
+        """Replace every weight at once, in O(n)"""
+        self.weights: List[float] = [float(w) for w in weights]
+        # 1-indexed, tree[i] sums the weights of (i - lowbit(i), i]
+        self.tree: List[float] = [0.0] + self.weights
+        for i in range(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def append(self, weight: float) -> None:
+        weight = float(weight)
+        self.weights.append(weight)
+        i = len(self.weights)
+        # The new node covers (i - lowbit(i), i], so it starts out with the sum of
+        # the nodes below it
+        total = weight
+        child = i - 1
+        stop = i - (i & -i)
+        while child > stop:
+            total += self.tree[child]
+            child -= child & -child
+        self.tree.append(total)
+
+    def update(self, index: int, weight: float) -> None:
+        weight = float(weight)
+        delta = weight - self.weights[index]
+        self.weights[index] = weight
+        i = index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def total(self) -> float:
+        total = 0.0
+        i = len(self.weights)
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def sample(self) -> int:
+        """Index drawn with probability proportional to its weight"""
+        remaining = random.random() * self.total()
+        position = 0
+        step = 1 << (len(self.weights).bit_length() - 1) if self.weights else 0
+        while step:
+            following = position + step
+            if following <= len(self.weights) and self.tree[following] <= remaining:
+                remaining -= self.tree[following]
+                position = following
+            step >>= 1
+        # Only past the end because of rounding
+        return min(position, len(self.weights) - 1)
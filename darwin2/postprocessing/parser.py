@@ -1,9 +1,16 @@
 import re
+from typing import List
+
+from darwin2.evaluating.evaluator import Evaluator
+
 
 class RegExParser:
+    # First markdown code block in a completion
+    CODE_BLOCK = re.compile(r"(?<!`)`{3}(?:(?!`)[^`]|\n|\r|\`(?!`))*?`{3}(?!`)")
+
     @staticmethod
     def parse(code: str) -> str:
-        parsed = re.search(r"(?<!`)`{3}(?:(?!`)[^`]|\n|\r|\`(?!`))*?`{3}(?!`)", code)
+        parsed = RegExParser.CODE_BLOCK.search(code)
         if parsed:
             try:
                 parsed = parsed.group(0)
@@ -13,3 +20,43 @@ class RegExParser:
                 return code
         return code
 
+
+class StreamWatcher:
+    """Decides when a streamed completion can be cut off
+
+    Chunks of the completion are passed to `feed`, which returns True as soon as the
+    first code block has been closed and contains a function, which is all that
+    `RegExParser.parse` will extract. `echoed` is then set if that function is one of
+    the `examples` that were put in the prompt, up to names, docstrings, comments and
+    formatting (see `Evaluator.normalize`). Blocks are only compared once closed, so
+    improvements that keep an example's signature and docstring aren't mistaken for
+    echoes.
+    """
+
+    def __init__(
+        self, examples: List[str] | None = None, base_function_name: str = ""
+    ) -> None:
+        self.text = ""
+        self.base_function_name = base_function_name
+        self.examples = {
+            Evaluator.normalize(e, base_function_name) for e in examples or []
+        }
+        self.examples.discard(None)
+        self.complete = False
+        self.echoed = False
+
+    def feed(self, chunk: str) -> bool:
+        self.text += chunk
+        if "`" in chunk:
+            block = RegExParser.CODE_BLOCK.search(self.text)
+            if block and "def" in block.group(0):
+                self.complete = True
+                self.echoed = self.__is_echo()
+                return True
+        return False
+
+    def __is_echo(self) -> bool:
+        if not self.examples:
+            return False
+        code = RegExParser.parse(self.text)
+        return Evaluator.normalize(code, self.base_function_name) in self.examples
@@ -1,4 +1,6 @@
 import ast
+import builtins
+from typing import Dict, Set
 
 def validate_syntax(code: str) -> bool:
     try:
@@ -6,3 +8,103 @@ def validate_syntax(code: str) -> bool:
     except:
         return False
     return True
+
+
+class Preflight:
+    """Cheap static checks a sample has to pass before it's worth evaluating
+
+    A sample must parse, define exactly one top-level function that can be called
+    like the evolved function and only use names it binds itself, the spec binds or
+    builtins. Names are resolved without regard to scope, which lets some broken
+    samples through but never rejects a working one.
+    """
+
+    SYNTAX = "syntax"
+    FUNCTION_COUNT = "function_count"
+    SIGNATURE = "signature"
+    UNRESOLVED_NAMES = "unresolved_names"
+
+    def __init__(self, spec: str, base_function_name: str) -> None:
+        tree = ast.parse(spec)
+        self.known_names: Set[str] = set(dir(builtins)) | {"__name__", "__file__"}
+        self.n_arguments: int | None = None
+        for node in ast.walk(tree):
+            self.known_names |= self.__bound_names(node)
+        for node in tree.body:
+            if isinstance(node, ast.FunctionDef) and node.name == base_function_name:
+                self.n_arguments = len(node.args.posonlyargs) + len(node.args.args)
+
+        self.n_passed: int = 0
+        self.n_rejected: Dict[str, int] = {}
+
+    def check(self, code: str) -> str | None:
+        """Reason to reject the sample (one of the class constants), None if it's fine"""
+        reason = self.__check(code)
+        if reason is None:
+            self.n_passed += 1
+        else:
+            self.n_rejected[reason] = self.n_rejected.get(reason, 0) + 1
+        return reason
+
+    def __check(self, code: str) -> str | None:
+        try:
+            tree = ast.parse(code)
+        except (SyntaxError, ValueError):
+            return self.SYNTAX
+
+        functions = [node for node in tree.body if isinstance(node, ast.FunctionDef)]
+        if len(functions) != 1:
+            return self.FUNCTION_COUNT
+        if self.n_arguments is not None and not self.__accepts(
+            functions[0].args, self.n_arguments
+        ):
+            return self.SIGNATURE
+
+        bound = set()
+        used = set()
+        for node in ast.walk(tree):
+            bound |= self.__bound_names(node)
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+                used.add(node.id)
+        # Can't tell what a star import binds
+        if "*" not in bound and "*" not in self.known_names:
+            if used - bound - self.known_names:
+                return self.UNRESOLVED_NAMES
+        return None
+
+    @staticmethod
+    def __accepts(args: ast.arguments, n: int) -> bool:
+        # Whether the function can be called with n positional arguments
+        positional = len(args.posonlyargs) + len(args.args)
+        required = positional - len(args.defaults)
+        required_keywords = any(default is None for default in args.kw_defaults)
+        return (
+            required <= n
+            and (n <= positional or args.vararg is not None)
+            and not required_keywords
+        )
+
+    @staticmethod
+    def __bound_names(node: ast.AST) -> Set[str]:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            return {node.name}
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            return {
+                (alias.asname or alias.name).split(".")[0] for alias in node.names
+            }
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            return {node.id}
+        if isinstance(node, ast.arg):
+            return {node.arg}
+        if isinstance(node, (ast.Global, ast.Nonlocal)):
+            return set(node.names)
+        if isinstance(node, ast.ExceptHandler) and node.name:
+            return {node.name}
+        if isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            return {node.name}
+        if isinstance(node, ast.MatchMapping) and node.rest:
+            return {node.rest}
+        return set()
+
+    def stats(self) -> Dict[str, int]:
+        return {"passed": self.n_passed, **self.n_rejected}
@@ -1,42 +1,72 @@
 import numpy as np
 import itertools
-from networkx import enumerate_all_cliques, from_numpy_array
+from darwin2.evaluating.cliques import adjacency_rows, count_cliques
 
-def solve(r: int, b: int, n: int) -> int:
+def compute_red_edges(n: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns the edges (i, j) with i <= j and whether priority makes each of them red.
+
+    Tries the batched contract first: priority is called once with arrays of all the edges'
+    vertices and should return a pair of arrays (red and blue priorities). If it doesn't
+    support that, or the batch disagrees with priority called on a few single edges, falls
+    back to calling priority once per edge.
+    """
+    from_vertices, to_vertices = np.triu_indices(n)
+
+    def scalar(i: int, j: int) -> bool:
+        prio = priority(int(i), int(j))
+        return bool(prio[0] > prio[1])
+
+    try:
+        batch = np.asarray(priority(from_vertices.copy(), to_vertices.copy()))
+    except Exception:
+        batch = None
+
+    if batch is not None and batch.shape == (2, len(from_vertices)):
+        red = batch[0] > batch[1]
+        checked = np.unique(np.linspace(0, len(from_vertices) - 1, 4).astype(int))
+        try:
+            agrees = all(
+                red[e] == scalar(from_vertices[e], to_vertices[e]) for e in checked
+            )
+        except Exception:
+            # Only works on batches
+            agrees = True
+        if agrees:
+            return from_vertices, to_vertices, red
+
+    red = np.array(
+        [scalar(i, j) for i, j in zip(from_vertices, to_vertices)], dtype=bool
+    )
+    return from_vertices, to_vertices, red
+
+
+def solve(r: int, b: int, n: int, limit: int = 1000000) -> int:
     mat_red = np.zeros((n, n))
     mat_blue = np.zeros((n, n))
     # Populate matrix based on priority
-    for i in range(n):
-        for j in range(i, n):
-            prio = priority(i, j)
-            # prio = priority(mat_red + 2 * mat_blue, i, j)
-            if prio[0] > prio[1]:
-                mat_red[i, j] = 1
-                mat_red[j, i] = 1
-            else:
-                mat_blue[i, j] = 1
-                mat_blue[j, i] = 1
-
-    # Check red cliques
-    n1 = n2 = 0
-    for i in enumerate_all_cliques(from_numpy_array(mat_red)):
-        if n1 >= 1000000:
-            break
-
-        if len(i) >= r:
-            n1 += 1
-
-    for i in enumerate_all_cliques(from_numpy_array(mat_blue)):
-        if n2 >= 1000000:
-            break
-        if len(i) >= b:
-            n2 += 1
+    # prio = priority(mat_red + 2 * mat_blue, i, j)
+    from_vertices, to_vertices, red = compute_red_edges(n)
+    mat_red[from_vertices[red], to_vertices[red]] = 1
+    mat_red[to_vertices[red], from_vertices[red]] = 1
+    mat_blue[from_vertices[~red], to_vertices[~red]] = 1
+    mat_blue[to_vertices[~red], from_vertices[~red]] = 1
+
+    # Count red cliques on r vertices and blue ones on b vertices (any larger clique
+    # contains one), giving up once either count is past the limit
+    n1 = count_cliques(adjacency_rows(mat_red), r, limit)
+    if n1 > limit:
+        return n1
+    n2 = count_cliques(adjacency_rows(mat_blue), b, limit)
 
     return max(n1, n2)
 
 
-def evaluate(r: int, b: int, n: int):
-    cliques = solve(r, b, n)
+def evaluate(r: int, b: int, n: int, limit: int = 1000000):
+    """Counting stops once a colouring has more than `limit` monochromatic cliques,
+    so every such colouring gets the same score. The limit is a fixed cap for the
+    whole run, set with a fourth input, e.g. (r, b, n, 500)"""
+    cliques = solve(r, b, n, limit)
     return -cliques if cliques else 1
 
 
@@ -54,6 +84,9 @@ def priority(from_vertex: int, to_vertex: int) -> tuple[int, int]:
     Return: A tuple of 2 integers representing the priority of making the edge from 'from_vertex' to 'to_vertex' either red or blue. The first index represents the 
     priority for red while the second index represents the priority for blue. If the value of the first index is larger than the value at the second index, the edge
     will be made red. Likewise, if the value at the second index is larger than the value at the first index, the edge will be made blue.
+
+    May also be called with NumPy arrays of vertices, one edge per position, in which case it should return a pair of arrays: the red
+    priorities and the blue priorities of every edge.
     """
     return (0, 0)
 
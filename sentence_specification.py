@@ -50,6 +50,91 @@ def block_strings(dictionary, priorities, sentence, chosen, t, k):
                 priorities[i] = -np.inf
 
 
+def block_candidates(
+    word_bits: np.ndarray,
+    priorities: np.ndarray,
+    sentence_bits: np.ndarray,
+    chosen_bits: np.ndarray,
+    k: int,
+) -> None:
+    """
+    Incremental version of block_strings, working on words encoded as one bit per symbol (so
+    every coordinate of a word is a bitset with a single bit set, see solve).
+
+    The sentence plus the chosen word is valid, and so is the sentence plus every word that
+    isn't blocked yet (that was checked when the previous word was chosen). So the only
+    combinations that can make a word invalid now are those with both the chosen word and that
+    word, plus k - 2 words of the sentence. For each such group of sentence words and the
+    chosen word we precompute, per coordinate, the bitset of symbols the group uses and whether
+    they're all different. A word is fine with the group if at some coordinate where the group
+    is all different, its symbol isn't in the group's bitset. Words that aren't fine with every
+    group get a priority of negative infinity.
+    """
+
+    candidates = np.flatnonzero(priorities != -np.inf)
+    if candidates.size == 0 or k < 2:
+        return
+
+    # Like check_valid_combination, sentences shorter than k are checked as a whole
+    others = min(k, len(sentence_bits) + 2) - 2
+    groups = list(itertools.combinations(range(len(sentence_bits)), others))
+    members = np.array(groups, dtype=np.intp).reshape(len(groups), others)
+
+    group_bits = np.broadcast_to(chosen_bits, (len(members), len(chosen_bits)))
+    distinct = np.ones(group_bits.shape, dtype=bool)
+    for j in range(others):
+        member_bits = sentence_bits[members[:, j]]
+        distinct &= (group_bits & member_bits) == 0
+        group_bits = group_bits | member_bits
+
+    # Groups with no coordinate where they're all different block every word
+    if not np.all(np.any(distinct, axis=1)):
+        priorities[candidates] = -np.inf
+        return
+
+    # Checked in chunks so the (words, groups, coordinates) arrays stay small
+    chunk = max(1, 2**22 // group_bits.size)
+    for start in range(0, candidates.size, chunk):
+        indices = candidates[start : start + chunk]
+        free = (word_bits[indices][:, np.newaxis, :] & group_bits[np.newaxis]) == 0
+        fine = np.all(np.any(free & distinct[np.newaxis], axis=2), axis=1)
+        priorities[indices[~fine]] = -np.inf
+
+
+def compute_priorities(dictionary: np.ndarray, t: int) -> np.ndarray:
+    """
+    Returns the priority of every word in the dictionary.
+
+    Tries the batched contract first: priority is called once with the whole dictionary (one
+    word per row) and should return an array with one priority per word. If it doesn't support
+    that, or the batch disagrees with priority called on a few single words, falls back to
+    calling priority once per word.
+    """
+
+    def scalar(word: np.ndarray) -> float:
+        return float(priority(tuple(word), t))
+
+    try:
+        batch = np.asarray(priority(dictionary.copy(), t), dtype=float)
+    except Exception:
+        batch = None
+
+    if batch is not None and batch.shape == (len(dictionary),):
+        checked = np.unique(np.linspace(0, len(dictionary) - 1, 4).astype(int))
+        try:
+            agrees = all(
+                np.isclose(batch[i], scalar(dictionary[i]), equal_nan=True)
+                for i in checked
+            )
+        except Exception:
+            # Only works on batches
+            agrees = True
+        if agrees:
+            return batch
+
+    return np.array([scalar(word) for word in dictionary])
+
+
 def solve(t: int, b: int, k: int) -> np.ndarray:
     """Calls the priority function and builds the sentence greedily"""
 
@@ -59,16 +144,27 @@ def solve(t: int, b: int, k: int) -> np.ndarray:
     )
 
     # Getting all priority values for each word in the dictionary
-    priorities = np.array([float(priority(tuple(word), t)) for word in dictionary])
+    priorities = compute_priorities(dictionary, t)
 
     # Sentence is the output
     sentence = np.empty((0, t), dtype=np.int32)
 
+    # Every symbol becomes a bit, so that the symbols used by a group of words at a coordinate
+    # form a bitset. Only works for alphabets that fit in an int64
+    word_bits = np.left_shift(1, dictionary, dtype=np.int64) if b <= 62 else None
+    chosen_indices = []
+
     while np.any(priorities != -np.inf):
         index = np.argmax(priorities)
         chosen = dictionary[index]
         priorities[index] = -np.inf
-        block_strings(dictionary, priorities, sentence, chosen, t, k)
+        if word_bits is not None:
+            block_candidates(
+                word_bits, priorities, word_bits[chosen_indices], word_bits[index], k
+            )
+        else:
+            block_strings(dictionary, priorities, sentence, chosen, t, k)
+        chosen_indices.append(index)
 
         # In the other funsearch implementations, chosen[None] would have been used
         # But I think that notation is confusing, and this does the same thing.
@@ -83,5 +179,10 @@ def evaluate(t: int, b: int, k: int) -> int:
 
 
 def priority(word: tuple[int, ...], t: int) -> float:
-    """Returns the priority in which we want to add a word to the sentence"""
+    """
+    Returns the priority in which we want to add a word to the sentence.
+
+    May also be called with a NumPy array holding one word per row, in which case it should
+    return an array with the priority of every row.
+    """
     return 0.0